@@ -9,9 +9,41 @@ from loadWordVec import *
 from hiddenLayer import *
 from convLayer import *
 from logisticRegression import *
+from numpyModel import wordArray
 
 sys.setrecursionlimit(40000)
 
+defaultMonitor={
+	'running':False,		#train precision averaged over the trained minibatches instead of a pass over the training set
+	'examples':1250,		#evaluate every this many training examples
+	'seconds':0,			#evaluate every this many seconds instead, if positive
+	'validateBatches':0		#num of validation minibatches sampled once for evaluations within an epoch, all if 0
+}
+
+def evalPrecision(evalModel,dataSet,batches,batchSize):
+	'''
+	>>>precision of the given minibatches of a set, the last partial minibatch is padded with zeros
+
+	>>>type evalModel: theano.function
+	>>>para evalModel: function mapping a minibatch of sentences to predicted labels
+	>>>type dataSet: dict
+	>>>para dataSet: {'x','y'} set
+	>>>type batches: list of int
+	>>>para batches: minibatch indices to evaluate
+	>>>type batchSize: int
+	>>>para batchSize: minibatch size the function is compiled with
+	'''
+	errors=0
+	num=0
+	for i in batches:
+		x=dataSet['x'][i*batchSize:(i+1)*batchSize]
+		y=dataSet['y'][i*batchSize:(i+1)*batchSize]
+		if len(y)<batchSize:
+			x=np.concatenate([x,np.zeros((batchSize-len(y),x.shape[1]),dtype=x.dtype)])
+		errors+=np.sum(evalModel(x)[:len(y)]!=y)
+		num+=len(y)
+	return 1-float(errors)/num
+
 def ReLU(x):
 	return T.switch(x<0,0,x)
 
@@ -151,6 +183,7 @@ class CNNModel(object):
 
 		self.cost=self.layer1.negative_log_likelyhood(self.y)
 		self.errors=self.layer1.errors(self.y)
+		self.errorCount=T.sum(T.neq(self.layer1.predict,self.y))
 
 		#for key in self.params:
 		#	print key.name,key.get_value().shape
@@ -160,10 +193,11 @@ class CNNModel(object):
 			for (paramI,gradI) in zip(self.params,grads)
 		]
 		self.adadeltaUpdate=AdadeltaUpdate(self.params,self.cost)
+		self.wordIndex=None			#map word to its row of wordVec, exported with the model if set
 
 		print 'the model '+self.name+' constructed!'
 
-	def train_validate_test(self,trainSet,validateSet,testSet,nEpoch):
+	def train_validate_test(self,trainSet,validateSet,testSet,nEpoch,monitor=None):
 		'''
 		>>>train and test the model
 
@@ -172,7 +206,12 @@ class CNNModel(object):
 
 		>>>type nEpoch: int
 		>>>para nEpoch: maximum iteration epoches
+		>>>type monitor: dict
+		>>>para monitor: evaluation settings overriding defaultMonitor
 		'''
+		settings=dict(defaultMonitor)
+		if monitor!=None:
+			settings.update(monitor)
 		print trainSet['x'].shape
 		trainSize=trainSet['x'].shape[0]
 		validateSize=validateSet['x'].shape[0]
@@ -180,13 +219,9 @@ class CNNModel(object):
 		trainX=theano.shared(trainSet['x'],borrow=True)
 		trainY=theano.shared(trainSet['y'],borrow=True)
 		trainY=T.cast(trainY,'int32')
-		validateX=theano.shared(validateSet['x'],borrow=True)
-		validateY=theano.shared(validateSet['y'],borrow=True)
-		validateY=T.cast(validateY,'int32')
-		testX=testSet['x']
-		testY=np.asarray(testSet['y'],'int32')
 		trainBatches=trainSize/self.batchSize
-		validateBatches=validateSize/self.batchSize
+		validateBatches=(validateSize+self.batchSize-1)/self.batchSize
+		testBatches=(testSize+self.batchSize-1)/self.batchSize
 
 		index=T.iscalar('index')
 		testMatrix=T.matrix('WordMatrix')
@@ -194,36 +229,34 @@ class CNNModel(object):
 		learnRate=T.scalar('lr')
 
 		trainModel=theano.function(
-		[index],self.cost,updates=self.adadeltaUpdate,
+		[index],[self.cost,self.errorCount,self.layer1.predict],updates=self.adadeltaUpdate,
 		givens={
 		self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
 		self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]})
 		print 'training model constructed!'
 
-		testTrain=theano.function(
-		[index],self.errors,
-		givens={
-		self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
-		self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]})
-		print 'test training set model constructed!'
+		if not settings['running']:
+			testTrain=theano.function(
+			[index],self.errors,
+			givens={
+			self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
+			self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]})
+			print 'test training set model constructed!'
 
-		validateModel=theano.function(
-		[index],self.errors,
-		givens={
-		self.x:validateX[index*self.batchSize:(index+1)*self.batchSize],
-		self.y:validateY[index*self.batchSize:(index+1)*self.batchSize]})
-		print 'validation model constructed!'
-
-		testLayer0Output=[]
-		testLayer0Input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape((testSize,1,self.sentenceLen,self.dimension))
+		evalLayer0Output=[]
+		evalLayer0Input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape((self.batchSize,1,self.sentenceLen,self.dimension))
 		for layer in self.layers0:
-			output=layer.process(testLayer0Input,testSize)
-			testLayer0Output.append(output.flatten(2))
-		testLayer1Input=T.concatenate(testLayer0Output,1)
-		testPredict=self.layer1.predictInstance(testLayer1Input)
-		testError=T.mean(T.neq(testPredict,self.y))
-		testModel=theano.function([self.x,self.y],testError)
-		print 'testing model constructed!'
+			output=layer.forward(evalLayer0Input,layer.shape,False)
+			evalLayer0Output.append(output.flatten(2))
+		evalLayer1Input=T.concatenate(evalLayer0Output,1)
+		evalPredict=self.layer1.predictInstance(evalLayer1Input)
+		evalModel=theano.function([self.x],evalPredict)
+		print 'evaluation model constructed!'
+
+		evalBatches=max(1,settings['examples']/self.batchSize)
+		sampleBatches=range(validateBatches)
+		if 0<settings['validateBatches']<validateSize/self.batchSize:
+			sampleBatches=np.random.permutation(validateSize/self.batchSize)[:settings['validateBatches']]
 
 		epoch=0
 		iteration=0
@@ -241,26 +274,34 @@ class CNNModel(object):
 		while epoch<nEpoch and iteration<maxIteration:
 			epoch+=1
 			num=0
+			runningError=[]
+			epochError=[]
+			lastEval=time.time()
 			for minBatch in np.random.permutation(range(trainBatches)):
-				cost=trainModel(minBatch)				#set zero func
+				cost,errorCount,predict=trainModel(minBatch)				#set zero func
+				runningError.append(errorCount)
+				epochError.append(errorCount)
 				x=float(epoch)+float(num+1)/float(trainBatches)-1
 				self.costValue.append({'x':x,'value':cost})
-				if num%50==0:
-					trainError=[
-						testTrain(i)
-						for i in xrange(trainBatches)
-					]
-					trainPrecision=1-np.mean(trainError)
-					validateError=[
-						validateModel(i)
-						for i in xrange(validateBatches)
-					]
-					validatePrecision=1-np.mean(validateError)
+				if settings['seconds']>0:
+					due=time.time()-lastEval>=settings['seconds']
+				else:
+					due=num%evalBatches==0
+				if due:
+					if settings['running']:
+						trainPrecision=1-float(np.sum(runningError))/(len(runningError)*self.batchSize)
+					else:
+						trainError=[
+							testTrain(i)
+							for i in xrange(trainBatches)
+						]
+						trainPrecision=1-np.mean(trainError)
+					validatePrecision=evalPrecision(evalModel,validateSet,sampleBatches,self.batchSize)
 					print 'epoch=%i,num=%i,train precision=%f%%, validation precision=%f%%'%(epoch,num,trainPrecision*100.,validatePrecision*100.)
 					self.trainAcc.append({'x':x,'acc':trainPrecision})
 					self.validateAcc.append({'x':x,'acc':validatePrecision})
 					if validatePrecision>bestValPrecision:
-						testError=testModel(testX,testY)
+						testError=1-evalPrecision(evalModel,testSet,xrange(testBatches),self.batchSize)
 						testPrecision=1-testError
 						minError=min(minError,testError)					
 						finalPrecision=testPrecision
@@ -268,24 +309,25 @@ class CNNModel(object):
 						print 'testing precision=%f%%'%(testPrecision*100.)
 						self.testAcc.append({'x':x,'acc':testPrecision})
 					print 'bestValPrecision=%f%%'%(bestValPrecision*100.)
+					runningError=[]
+					lastEval=time.time()
 				num+=1
 
 			x=float(epoch)
-			trainError=[
-				testTrain(i)
-				for i in xrange(trainBatches)
-			]
-			trainPrecision=1-np.mean(trainError)
-			validateError=[
-				validateModel(i)
-				for i in xrange(validateBatches)
-			]
-			validatePrecision=1-np.mean(validateError)
+			if settings['running']:
+				trainPrecision=1-float(np.sum(epochError))/(len(epochError)*self.batchSize)
+			else:
+				trainError=[
+					testTrain(i)
+					for i in xrange(trainBatches)
+				]
+				trainPrecision=1-np.mean(trainError)
+			validatePrecision=evalPrecision(evalModel,validateSet,xrange(validateBatches),self.batchSize)
 			print 'epoch=%i,train precision=%f%%, validation precision=%f%%'%(epoch,trainPrecision*100.,validatePrecision*100.)
 			self.trainAcc.append({'x':x,'acc':trainPrecision})
 			self.validateAcc.append({'x':x,'acc':validatePrecision})
 			if validatePrecision>bestValPrecision:
-				testError=testModel(testX,testY)
+				testError=1-evalPrecision(evalModel,testSet,xrange(testBatches),self.batchSize)
 				testPrecision=1-testError
 				minError=min(minError,testError)
 				finalPrecision=testPrecision
@@ -304,3 +346,26 @@ class CNNModel(object):
 		timeStruct=time.localtime(time.time())
 		fileName=str(timeStruct.tm_mon)+'_'+str(timeStruct.tm_mday)+'_'+str(timeStruct.tm_hour)+'_'+str(timeStruct.tm_min)+'__'+str(self.result['finalAcc'])+'_'+self.name
 		cPickle.dump([self.result,self.trainAcc,self.validateAcc,self.testAcc,self.costValue],open(savePath+fileName,'wb'))
+
+	def export(self,fileName):
+		'''
+		>>>dump the parameters, the architecture and the words of the rows to a *.npz file, loaded by numpyModel.NumpyCNNModel for inference without theano
+
+		>>>type fileName: str
+		>>>para fileName: *.npz file
+		'''
+		arrays={
+			'filters':np.array([layer.filters[2] for layer in self.layers0]),
+			'dropout':np.array([layer.dropoutRate for layer in self.layers0]),
+			'sentenceLen':self.sentenceLen,
+			'batchSize':self.batchSize,
+			'w':self.layer1.w.get_value(),
+			'b':self.layer1.b.get_value(),
+			'wordVec':self.wordVec.get_value()
+		}
+		if self.wordIndex!=None:
+			arrays['words']=wordArray(self.wordIndex,len(arrays['wordVec']))
+		for i,layer in enumerate(self.layers0):
+			arrays['w_%d'%i]=layer.w.get_value()
+			arrays['b_%d'%i]=layer.b.get_value()
+		np.savez(fileName,**arrays)
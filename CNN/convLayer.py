@@ -7,7 +7,7 @@ from theano.tensor.signal import downsample
 
 class ConvPool(object):
 
-	def __init__(self, rng, input,shape,filters,pool):
+	def __init__(self, rng, input,shape,filters,pool,dropout=0.0):
 		'''
 		>>>type rng: numpy.random.RandomState
 		>>>para rng: initalize weight randomly
@@ -23,9 +23,14 @@ class ConvPool(object):
 
 		>>>type pool: tuple or list of length 2
 		>>>para pool: pooling size
+
+		>>>type dropout: float
+		>>>para dropout: dropout rate of the output, no dropout if 0
 		'''
 
 		assert filters[1]==shape[1]
+		self.rng=rng
+		self.dropoutRate=dropout
 		self.input=input
 		self.shape=shape
 		self.filters=filters
@@ -53,48 +58,42 @@ class ConvPool(object):
 			borrow=True
 			)
 
-		#build up convolutional layer
-		conv_out=conv.conv2d(
-			input=input,
-			filters=self.w,
-			filter_shape=filters,
-			image_shape=shape
-			)
-
-		#build up pooling layer
-		pool_out=downsample.max_pool_2d(
-			input=conv_out,
-			ds=pool,
-			ignore_border=True
-			)
-
-		self.output=T.tanh(pool_out+self.b.dimshuffle('x',0,'x','x'))
+		self.output=self.forward(input,shape)
 
 		self.param=[self.w,self.b]
 
-	def process(self,data,batchSize):
+	def forward(self,input,shape,train=True):
 		'''
-		>>>process newly input data
+		>>>build the convolution and pooling of input, sharing the weights of this layer
 
-		>>>type data: T.tensor4
-		>>>para data: newly input data
-		>>>type batchSize: int
-		>>>para batchSize: minibatch size
+		>>>type input: T.tensor4
+		>>>para input: input data
+		>>>type shape: tuple or list of length 4
+		>>>para shape: (batch size, num of input feature maps, image height, image width)
+		>>>type train: boolean
+		>>>para train: drop units randomly if True, scale them by the keep rate otherwise
 		'''
-		shape=(batchSize,1,self.shape[2],self.shape[3])
-
+		#build up convolutional layer
 		conv_out=conv.conv2d(
-			input=data,
+			input=input,
 			filters=self.w,
 			filter_shape=self.filters,
 			image_shape=shape
-		)
+			)
+
+		#build up pooling layer
 		pool_out=downsample.max_pool_2d(
 			input=conv_out,
 			ds=self.pool,
 			ignore_border=True
-		)
+			)
+
 		output=T.tanh(pool_out+self.b.dimshuffle('x',0,'x','x'))
+		if self.dropoutRate>0:
+			if train:
+				output=dropoutFunc(self.rng,output,self.dropoutRate)
+			else:
+				output=output*(1.0-self.dropoutRate)
 		return output
 
 def dropoutFunc(rng,value,p):
@@ -115,10 +114,4 @@ def dropoutFunc(rng,value,p):
 class DropoutConvPool(ConvPool):
 
 	def __init__(self,rng,input,shape,filters,pool,dropout=0.5):
-		ConvPool.__init__(self,rng,input,shape,filters,pool)
-		self.dropoutRate=dropout
-		self.output=dropoutFunc(rng,self.output,dropout)
-
-	def process(self,data,batchSize):
-		output=ConvPool.process(self,data,batchSize)
-		return output*self.dropoutRate
+		ConvPool.__init__(self,rng,input,shape,filters,pool,dropout)
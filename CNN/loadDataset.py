@@ -0,0 +1,277 @@
+import numpy as np
+
+from loadWordVec import *
+
+def floatX():
+	'''
+	>>>the float type of theano for the training sets, theano is only loaded here so that prediction with numpyModel does not need it
+	'''
+	import theano
+	return theano.config.floatX
+
+def loadCompactData(fileName,phrases=False):
+	'''
+	>>>load a dataset saved in the compact format by parseMR.py/parseSST.py
+
+	>>>type fileName: str
+	>>>para fileName: *.npz file
+	>>>type phrases: bool
+	>>>para phrases: append the phrases saved by parseSST.py -phrases as extra instances in the subsets of their sentences
+	'''
+	data=np.load(fileName)
+	corpus={}
+	for key in ['tokens','offsets','label','setLabel','len']:
+		corpus[key]=data[key]
+	if phrases and 'phraseRow' in data.files:
+		#a phrase is a span of the tokens of its sentence, so only its start is added, not its words
+		rows=data['phraseRow']
+		corpus['starts']=np.concatenate([corpus['offsets'][:-1],corpus['offsets'][rows]+data['phraseStart']])
+		corpus['len']=np.concatenate([corpus['len'],data['phraseLen']])
+		corpus['label']=np.concatenate([corpus['label'],data['phraseLabel']])
+		corpus['setLabel']=np.concatenate([corpus['setLabel'],corpus['setLabel'][rows]])
+	corpus['words']=data['words'].tolist()
+	vocab=dict(zip(corpus['words'][1:],data['docFreq'][1:].tolist()))
+	config={
+		'classes':int(data['classes']),
+		'all':data['all'].tolist(),
+		'train':data['train'].tolist(),
+		'test':data['test'].tolist(),
+		'dev':data['dev'].tolist(),
+		'cross':bool(data['cross'])
+	}
+	return corpus,vocab,config
+
+def unknownEntry(word,wordIndex,rows):
+	'''
+	>>>entry of a word left out of wordIndex, e.g. by the frequency cutoff of Vocabulary: its hash bucket or the UNK row, the padding row if the matrix has neither
+	'''
+	entries=wordEntries([word],wordIndex,rows)
+	return entries[0] if len(entries)>0 else 0
+
+def wordDropout(corpus,wordIndex,rows,freq,alpha=0.25):
+	'''
+	>>>prepare word dropout for the UNK row and the hash buckets: a token of a vocabulary word is replaced by the row the word would have if unseen
+	>>>with probability alpha/(alpha+freq), so rare training words train the rows unseen words are mapped to at prediction, nothing is done without an UNK row
+
+	>>>type corpus: dict
+	>>>para corpus: dataset in the compact format, gets 'unseenEntry' and 'dropRate' of each row for dropWords
+	>>>type wordIndex: dict
+	>>>para wordIndex: map word to its entry
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix
+	>>>type freq: np.array
+	>>>para freq: document frequency of the word of each row of the vocabulary, e.g. Vocabulary.freq
+	>>>type alpha: float
+	>>>para alpha: a word of frequency alpha is dropped half of the time
+	'''
+	if rows<=len(wordIndex)+1:
+		return corpus
+	unseen=np.arange(rows,dtype='int32')
+	rate=np.zeros(rows)
+	for word,index in wordIndex.items():
+		unseen[index]=unseenEntry(word,len(wordIndex),rows)
+		rate[index]=alpha/(alpha+freq[index])
+	corpus['unseenEntry']=unseen
+	corpus['dropRate']=rate
+	return corpus
+
+def dropWords(dataSet,corpus):
+	'''
+	>>>apply the word dropout prepared by wordDropout to a training set or its length buckets, the tokens to replace are drawn once with np.random
+
+	>>>type dataSet: dict or list of dict
+	>>>para dataSet: {'x','y'} training set, or a list of its length buckets
+	>>>type corpus: dict
+	>>>para corpus: dataset prepared by wordDropout, the set is left as it is without 'dropRate'
+	'''
+	if 'dropRate' not in corpus:
+		return dataSet
+	replaced=0
+	trained=set()
+	for subset in (dataSet if isinstance(dataSet,list) else [dataSet]):
+		x=subset['x'].astype('int32')
+		drop=np.random.random_sample(x.shape)<corpus['dropRate'][x]
+		subset['x'][drop]=corpus['unseenEntry'][x[drop]]
+		replaced+=drop.sum()
+		trained.update(np.unique(corpus['unseenEntry'][x[drop]]).tolist())
+	rows=len(np.unique(corpus['unseenEntry'][corpus['dropRate']>0]))
+	print 'word dropout: %d tokens replaced, %d of %d UNK/bucket rows trained'%(replaced,len(trained),rows)
+	return dataSet
+
+def compactSentences(sentences,wordIndex,rows=None):
+	'''
+	>>>convert a list of sentence dicts to the compact format, token ids are entries of wordIndex
+
+	>>>type sentences: list
+	>>>para sentences: each entry is {'label','text','setLabel','len'}
+	>>>type wordIndex: dict
+	>>>para wordIndex: map word to its entry
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix, words outside wordIndex are mapped by unknownEntry if not None
+	'''
+	lookup=wordIndex
+	if rows!=None:
+		lookup=dict(wordIndex)
+		for sentence in sentences:
+			for word in sentence['text']:
+				if word not in lookup:
+					lookup[word]=unknownEntry(word,wordIndex,rows)
+	lengths=np.array([len(sentence['text']) for sentence in sentences],dtype='int32')
+	offsets=np.zeros(len(sentences)+1,dtype='int64')
+	offsets[1:]=np.cumsum(lengths)
+	corpus={}
+	corpus['tokens']=np.fromiter(
+		(lookup[word] for sentence in sentences for word in sentence['text']),
+		dtype='int32',count=offsets[-1]
+	)
+	corpus['offsets']=offsets
+	corpus['label']=np.array([sentence['label'] for sentence in sentences],dtype='int32')
+	corpus['setLabel']=np.array([sentence['setLabel'] for sentence in sentences],dtype='int32')
+	corpus['len']=lengths
+	return corpus
+
+def remapCompactData(corpus,wordIndex,rows=None):
+	'''
+	>>>map the dataset's word ids in corpus['tokens'] to entries of wordIndex
+
+	>>>type corpus: dict
+	>>>para corpus: dataset loaded by loadCompactData
+	>>>type wordIndex: dict
+	>>>para wordIndex: map word to its entry
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix, words outside wordIndex are mapped by unknownEntry if not None
+	'''
+	words=corpus['words']
+	idMap=np.zeros(len(words),dtype='int32')
+	for i in xrange(1,len(words)):
+		if rows==None or words[i] in wordIndex:
+			idMap[i]=wordIndex[words[i]]
+		else:
+			idMap[i]=unknownEntry(words[i],wordIndex,rows)
+	corpus['tokens']=idMap[corpus['tokens']]
+	return corpus
+
+def encodeCorpus(corpus,maxLen,index=None):
+	'''
+	>>>convert sentences to one matrix of word entries, each sentence is centered with zeros padded on both sides
+
+	>>>type corpus: dict
+	>>>para corpus: dataset in the compact format, corpus['starts'] gives the first token of each instance if the dataset has phrases
+	>>>type maxLen: int
+	>>>para maxLen: maximum length of the sentences to convert
+	>>>type index: np.array
+	>>>para index: indices of the sentences to convert, all sentences if None
+	'''
+	lengths=corpus['len'].astype('int64')
+	starts=corpus['starts'] if 'starts' in corpus else corpus['offsets'][:-1]
+	if index is not None:
+		lengths=lengths[index]
+		starts=starts[index]
+	sentenceNum=len(lengths)
+	matrix=np.zeros(shape=(sentenceNum,maxLen),dtype='int32')
+	padLeft=(maxLen-lengths+1)/2
+	rows=np.repeat(np.arange(sentenceNum),lengths)
+	positions=np.arange(lengths.sum())-np.repeat(np.cumsum(lengths)-lengths,lengths)
+	matrix[rows,positions+np.repeat(padLeft,lengths)]=corpus['tokens'][np.repeat(starts,lengths)+positions]
+	return matrix
+
+def subsetIndex(setLabels,subsets):
+	'''
+	>>>indices of the sentences in the given subsets, subset by subset
+
+	>>>type setLabels: np.array
+	>>>para setLabels: subset ID of each sentence
+	>>>type subsets: list of int
+	>>>para subsets: subset IDs
+	'''
+	if len(subsets)==0:
+		return np.zeros(0,dtype='int64')
+	return np.concatenate([np.where(setLabels==subset)[0] for subset in subsets])
+
+def splitValidation(index,labels,categories,ratio=0.1):
+	'''
+	>>>randomly hold out ratio of index as validation set, with the same number of instances for each category
+
+	>>>type index: np.array
+	>>>para index: indices of the training set
+	>>>type labels: np.array
+	>>>para labels: category of each sentence
+	>>>type categories: int
+	>>>para categories: num of categories
+	'''
+	index=index[np.random.permutation(len(index))]
+	validateEachType=int(len(index)*ratio/categories)
+	isValidation=np.zeros(len(index),dtype='bool')
+	for category in xrange(categories):
+		isValidation[np.where(labels[index]==category)[0][:validateEachType]]=True
+	return index[~isValidation],index[isValidation]
+
+def fillBatches(index,batchSize):
+	'''
+	>>>append randomly chosen indices so that the set is divisible by batchSize
+
+	>>>type index: np.array
+	>>>para index: indices of a subset
+	>>>type batchSize: int
+	>>>para batchSize: minibatch size
+	'''
+	if len(index)%batchSize>0:
+		extraNum=batchSize-len(index)%batchSize
+		extraIndex=np.resize(np.random.permutation(len(index)),extraNum)
+		index=np.concatenate([index,index[extraIndex]])
+	return index
+
+def makeSet(matrix,labels,index):
+	'''
+	>>>gather the sentences in index into a {'x','y'} set
+
+	>>>type matrix: np.array
+	>>>para matrix: encoded sentences
+	>>>type labels: np.array
+	>>>para labels: category of each sentence
+	>>>type index: np.array
+	>>>para index: indices of the subset
+	'''
+	return {
+		'x':np.asarray(matrix[index],dtype=floatX()),
+		'y':np.asarray(labels[index],dtype=floatX())
+	}
+
+def bucketBounds(lengths,buckets,minLen=1):
+	'''
+	>>>split sentences into length buckets of about the same size, return the padded length of each bucket
+
+	>>>type lengths: np.array
+	>>>para lengths: length of each sentence
+	>>>type buckets: int
+	>>>para buckets: num of buckets
+	>>>type minLen: int
+	>>>para minLen: minimum padded length, e.g. the largest filter height
+	'''
+	bounds=np.percentile(lengths,np.linspace(0,100,buckets+1)[1:],interpolation='higher')
+	return np.unique(np.maximum(bounds.astype('int64'),minLen)).tolist()
+
+def makeBucketSets(corpus,index,bounds,batchSize=None):
+	'''
+	>>>split a subset into length buckets, each padded to its own bound, return a list of {'x','y'} sets
+
+	>>>type corpus: dict
+	>>>para corpus: dataset in the compact format
+	>>>type index: np.array
+	>>>para index: indices of the subset
+	>>>type bounds: list of int
+	>>>para bounds: padded length of each bucket, in increasing order
+	>>>type batchSize: int
+	>>>para batchSize: fill each bucket to be divisible by batchSize if not None
+	'''
+	bucket=np.searchsorted(bounds,corpus['len'][index])
+	sets=[]
+	for i in xrange(len(bounds)):
+		bucketIndex=index[bucket==i]
+		if batchSize!=None:
+			bucketIndex=fillBatches(bucketIndex,batchSize)
+		sets.append({
+			'x':np.asarray(encodeCorpus(corpus,bounds[i],bucketIndex),dtype=floatX()),
+			'y':np.asarray(corpus['label'][bucketIndex],dtype=floatX())
+		})
+	return sets
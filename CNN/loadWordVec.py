@@ -1,71 +1,254 @@
 import cPickle
-import theano
+import hashlib
+import mmap
+import os
+import zlib
 import numpy as np
 
+def indexBinVec(buf,vocab):
+	'''
+	>>>scan the mapped *.bin file once and locate the vectors of the vocabulary
+
+	>>>type buf: mmap.mmap
+	>>>para buf: memory-mapped *.bin file
+	>>>type vocab: dict or set
+	>>>para vocab: words to look up
+	'''
+	headerEnd=buf.find('\n')
+	vocabSize,layerSize=map(int,buf[:headerEnd].split())
+	binaryLen=np.dtype('float32').itemsize*layerSize
+	words=[]
+	offsets=[]
+	pos=headerEnd+1
+	for line in xrange(vocabSize):
+		end=buf.find(' ',pos)
+		word=buf[pos:end].lstrip('\n')
+		if word in vocab:
+			words.append(word)
+			offsets.append(end+1)
+		pos=end+1+binaryLen
+	return layerSize,words,offsets
+
 def loadBinVec(fileName,vocab):
 	'''
 	>>>load *.bin file and return word embeddings of the vocabulary, and its dimension
 	'''
-	wordVec={}
 	with open(fileName,'rb') as fopen:
-		header=fopen.readline()
-		vocabSize,layerSize=map(int,header.split())
-		binaryLen=np.dtype('float32').itemsize*layerSize
-		for line in xrange(vocabSize):
-			word=[]
-			while True:
-				ch=fopen.read(1)
-				if ch==' ':
-					word=''.join(word)
-					break
-				else:
-					word.append(ch)
-			if word in vocab:
-				wordVec[word]=np.fromstring(fopen.read(binaryLen),dtype='float32')
-			else:
-				fopen.read(binaryLen)
+		buf=mmap.mmap(fopen.fileno(),0,access=mmap.ACCESS_READ)
+	layerSize,words,offsets=indexBinVec(buf,vocab)
+	matrix=np.empty(shape=(len(words),layerSize),dtype='float32')
+	for i in xrange(len(words)):
+		matrix[i]=np.frombuffer(buf,dtype='float32',count=layerSize,offset=offsets[i])
+	buf.close()
+	wordVec={}
+	for i in xrange(len(words)):
+		wordVec[words[i]]=matrix[i]
 	return layerSize,wordVec
 
-def getWordVec(configFileName,vecFileName):
+class Vocabulary(object):
 	'''
-	>>>load wordvecs and initialize unknow word's vector randomly
+	>>>words of a dataset with deterministic ids: 0 is reserved for padding, 1.. follow decreasing document frequency with ties broken by the word
+	>>>frequent words get the first rows of the embedding matrix, and the same data always gives the same ids
+	'''
+	def __init__(self,vocab,minFreq=1,maxSize=0):
+		'''
+		>>>type vocab: dict
+		>>>para vocab: document frequency of each word
+		>>>type minFreq: float
+		>>>para minFreq: words of lower document frequency are left out
+		>>>type maxSize: int
+		>>>para maxSize: keep at most this num of the most frequent words, no cap if 0
+		'''
+		words=sorted([word for word in vocab if vocab[word]>=minFreq],key=lambda word:(-vocab[word],word))
+		if maxSize>0:
+			words=words[:maxSize]
+		self.words=['']+words
+		self.freq=np.array([0.]+[vocab[word] for word in words])
+		self.wordIndex=dict(zip(words,xrange(1,len(self.words))))
+		self.dropped=len(vocab)-len(words)
+
+	def __len__(self):
+		return len(self.words)-1
+
+	def __iter__(self):
+		return iter(self.words[1:])
+
+	def __contains__(self,word):
+		return word in self.wordIndex
+
+	def save(self,fileName):
+		'''
+		>>>save the words in id order and their frequencies as two arrays of a *.npz file
+		'''
+		np.savez(fileName,words=np.array(self.words),freq=self.freq)
+
+def loadVocabulary(fileName,vocab=None):
 	'''
+	>>>load a vocabulary saved by Vocabulary.save, with the same ids
+
+	>>>type fileName: str
+	>>>para fileName: *.npz file written by Vocabulary.save
+	>>>type vocab: dict
+	>>>para vocab: words of the dataset the vocabulary is reused on, its words missing from the file are counted as dropped
+	'''
+	data=np.load(fileName)
+	vocabulary=Vocabulary(dict(zip(data['words'][1:].tolist(),data['freq'][1:].tolist())))
+	if vocab!=None:
+		vocabulary.dropped=len([word for word in vocab if word not in vocabulary])
+	return vocabulary
+
+def asVocabulary(vocab):
+	'''
+	>>>the Vocabulary of a dict of document frequencies or a set of words, without cutoff
+	'''
+	if isinstance(vocab,Vocabulary):
+		return vocab
+	if not isinstance(vocab,dict):
+		vocab=dict.fromkeys(vocab,1.)
+	return Vocabulary(vocab)
+
+def vocabWordVec(vocab,vecFileName):
+	'''
+	>>>load wordvecs of the vocabulary and initialize unknow word's vector randomly, row i of the result is the word of id i in Vocabulary
+	'''
+	vocabulary=asVocabulary(vocab)
 	num=0
-	data=cPickle.load(open(configFileName,'rb'))
-	dimension,wordVec=loadBinVec(vecFileName,data[1])
-	for word in data[1]:
-		if word not in wordVec:
+	dimension,wordVec=loadBinVec(vecFileName,vocabulary.wordIndex)
+	vectors=np.zeros(shape=(len(vocabulary)+1,dimension))
+	for index in xrange(1,len(vocabulary.words)):
+		word=vocabulary.words[index]
+		if word in wordVec:
+			vectors[index]=wordVec[word]
+		else:
 			num+=1
-			wordVec[word]=np.random.uniform(-0.25,0.25,dimension)
-
-	vocabSize=len(data[1])
-	vectors=np.zeros(shape=(vocabSize+1,dimension))
-	wordIndex={}
-	vectors[0]=np.zeros(dimension)
-	index=1
-	for word in wordVec:
-		vectors[index]=wordVec[word]
-		wordIndex[word]=index
-		index+=1
+			vectors[index]=np.random.uniform(-0.25,0.25,dimension)
 	print 'word not found: ',num
+	return vectors,dict(vocabulary.wordIndex)
+
+def getWordVec(configFileName,vecFileName):
+	'''
+	>>>load wordvecs and initialize unknow word's vector randomly
+	'''
+	data=cPickle.load(open(configFileName,'rb'))
+	return vocabWordVec(data[1],vecFileName)
+
+def cacheKey(vocab,vecFileName):
+	'''
+	>>>hash the vocabulary together with the size and mtime of the wordVec file
+
+	>>>type vocab: Vocabulary, dict or set
+	>>>para vocab: words of the dataset
+	>>>type vecFileName: str
+	>>>para vecFileName: *.bin file of word embeddings
+	'''
+	stat=os.stat(vecFileName)
+	md5=hashlib.md5()
+	#the ids of a Vocabulary are part of the key, the words of a dict or set are hashed in sorted order
+	for word in (vocab.words[1:] if isinstance(vocab,Vocabulary) else sorted(vocab)):
+		md5.update(word+'\n')
+	md5.update('%s|%d|%d'%(os.path.basename(vecFileName),stat.st_size,int(stat.st_mtime)))
+	return md5.hexdigest()
+
+def getCachedWordVec(vocab,vecFileName,cacheDir):
+	'''
+	>>>load the vocabulary-filtered wordvecs from cacheDir, scan the *.bin file and fill the cache on a miss
+
+	>>>type vocab: Vocabulary, dict or set
+	>>>para vocab: words of the dataset
+	>>>type vecFileName: str
+	>>>para vecFileName: *.bin file of word embeddings
+	>>>type cacheDir: str
+	>>>para cacheDir: folder of cached matrices (*.npy) and word lists (*.idx)
+	'''
+	key=cacheKey(vocab,vecFileName)
+	matrixFile=os.path.join(cacheDir,key+'.npy')
+	indexFile=os.path.join(cacheDir,key+'.idx')
+	if os.path.exists(matrixFile) and os.path.exists(indexFile):
+		vectors=np.load(matrixFile,mmap_mode='r')
+		wordIndex={}
+		with open(indexFile,'rb') as fopen:
+			index=1
+			for line in fopen:
+				wordIndex[line[:-1]]=index
+				index+=1
+		print 'wordVec loaded from cache '+key
+		return vectors,wordIndex
+
+	vectors,wordIndex=vocabWordVec(vocab,vecFileName)
+	if not os.path.exists(cacheDir):
+		os.makedirs(cacheDir)
+	words=sorted(wordIndex,key=wordIndex.get)
+	with open(indexFile+'.tmp','wb') as fwrite:
+		for word in words:
+			fwrite.write(word+'\n')
+	with open(matrixFile+'.tmp','wb') as fwrite:
+		np.save(fwrite,vectors)
+	os.rename(matrixFile+'.tmp',matrixFile)
+	os.rename(indexFile+'.tmp',indexFile)
+	print 'wordVec cached as '+key
 	return vectors,wordIndex
 
+def vocabRandWordVec(vocab,dimension):
+	'''
+	>>>initialize the word vectors of the vocabulary randomly given a dimension value, row i of the result is the word of id i in Vocabulary
+	'''
+	vocabulary=asVocabulary(vocab)
+	vectors=np.zeros(shape=(len(vocabulary)+1,dimension))
+	vectors[1:]=np.random.uniform(-0.25,0.25,(len(vocabulary),dimension))
+	return vectors,dict(vocabulary.wordIndex)
+
+def addUnknownVec(vectors,hashBuckets=0):
+	'''
+	>>>append a reserved UNK row and hashBuckets rows for words outside the vocabulary, after the rows of the vocabulary
+	>>>they start from zeros, so that unless training reaches them, e.g. by word dropout, an unseen word adds nothing like padding instead of random noise
+
+	>>>type vectors: np.array
+	>>>para vectors: word embeddings, row 0 for padding and rows 1..len(wordIndex) for the vocabulary
+	>>>type hashBuckets: int
+	>>>para hashBuckets: num of rows unknown words are hashed to, all of them share the UNK row if 0
+	'''
+	return np.concatenate([vectors,np.zeros((hashBuckets+1,vectors.shape[1]),dtype=vectors.dtype)])
+
+def unseenEntry(word,vocabSize,rows):
+	'''
+	>>>row of a word outside the vocabulary: its hash bucket, or the UNK row if there are no buckets
+
+	>>>type word: str
+	>>>para word: the word
+	>>>type vocabSize: int
+	>>>para vocabSize: num of words of the vocabulary, whose rows are 1..vocabSize, the UNK row follows them
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix, with the UNK row
+	'''
+	unknown=vocabSize+1
+	hashBuckets=rows-unknown-1
+	if hashBuckets>0:
+		return unknown+1+(zlib.crc32(word)&0xffffffff)%hashBuckets
+	return unknown
+
+def wordEntries(words,wordIndex,rows):
+	'''
+	>>>map words to their rows of the embedding matrix, words outside wordIndex go to a hash bucket, or to the UNK row, or are dropped if the matrix has no UNK row
+
+	>>>type words: list of str
+	>>>para words: tokens of a sentence
+	>>>type wordIndex: dict
+	>>>para wordIndex: map word to its entry
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix, tells whether addUnknownVec was applied and with how many buckets
+	'''
+	unknownRow=rows>len(wordIndex)+1
+	entries=[]
+	for word in words:
+		if word in wordIndex:
+			entries.append(wordIndex[word])
+		elif unknownRow:
+			entries.append(unseenEntry(word,len(wordIndex),rows))
+	return entries
+
 def getRandWordVec(configFileName,dimension):
 	'''
 	>>>initialize the word vectors randomly given a dimension value
 	'''
 	data=cPickle.load(open(configFileName,'rb'))
-	wordVec={}
-	for word in data[1]:
-		wordVec[word]=np.random.uniform(-0.25,0.25,dimension)
-
-	vocabSize=len(data[1])
-	vectors=np.zeros(shape=(vocabSize+1,dimension))
-	wordIndex={}
-	vectors[0]=np.zeros(dimension)
-	index=1
-	for word in wordVec:
-		vectors[index]=wordVec[word]
-		wordIndex[word]=index
-		index+=1
-	return vectors,wordIndex
+	return vocabRandWordVec(data[1],dimension)
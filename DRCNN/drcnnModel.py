@@ -11,9 +11,41 @@ from logisticRegression import *
 from normLayer import *
 from recurrentConvLayer import *
 from convLayer import *
+from numpyModel import wordArray
 
 sys.setrecursionlimit(40000)
 
+defaultMonitor={
+    'running':False,        #train accuracy averaged over the trained minibatches instead of a pass over the training set
+    'examples':1250,        #evaluate every this many training examples
+    'seconds':0,            #evaluate every this many seconds instead, if positive
+    'validateBatches':0     #num of validation minibatches sampled once for evaluations within an epoch, all if 0
+}
+
+def evalPrecision(evalModel,dataSet,batches,batchSize):
+    '''
+    >>>precision of the given minibatches of a set, the last partial minibatch is padded with zeros
+
+    >>>type evalModel: theano.function
+    >>>para evalModel: function mapping a minibatch of sentences to predicted labels
+    >>>type dataSet: dict
+    >>>para dataSet: {'x','y'} set
+    >>>type batches: list of int
+    >>>para batches: minibatch indices to evaluate
+    >>>type batchSize: int
+    >>>para batchSize: minibatch size the function is compiled with
+    '''
+    errors=0
+    num=0
+    for i in batches:
+        x=dataSet['x'][i*batchSize:(i+1)*batchSize]
+        y=dataSet['y'][i*batchSize:(i+1)*batchSize]
+        if len(y)<batchSize:
+            x=np.concatenate([x,np.zeros((batchSize-len(y),x.shape[1]),dtype=x.dtype)])
+        errors+=np.sum(evalModel(x)[:len(y)]!=y)
+        num+=len(y)
+    return 1-float(errors)/num
+
 def ReLU(x):
 	return T.switch(x>0,x,0)
 
@@ -224,6 +256,7 @@ class DRCNNModel(object):
 
         self.cost=self.classifier.negative_log_likelyhood(self.y)+1e-5*weights
         self.errors=self.classifier.errors(self.y)
+        self.errorCount=T.sum(T.neq(self.classifier.predict,self.y))
         
         grads=T.grad(self.cost,self.params)
         self.update=[
@@ -233,10 +266,11 @@ class DRCNNModel(object):
         self.sgdMomentumUpdate=sgdMomentum(self.params,self.cost,self.lr)
         self.adadeltaUpdate=AdadeltaUpdate(self.params,self.cost)
         self.adadeltaMomentumUpdate=AdadeltaMomentumUpdate(params=self.params,cost=self.cost,stepSize=self.lr)
+        self.wordIndex=None         #map word to its row of wordVec, exported with the model if set
 
         print 'model %s constructed!'%name
 
-    def train_validate_test(self,trainSet,validateSet,testSet,nEpoch):
+    def train_validate_test(self,trainSet,validateSet,testSet,nEpoch,monitor=None):
         '''
         >>>train and test the model
 
@@ -244,7 +278,12 @@ class DRCNNModel(object):
         >>>para trainSet/validateSet/testSet: train/validate/test set
         >>>type nEpoch: int
         >>>para nEpoch: maximum iteration epoches
+        >>>type monitor: dict
+        >>>para monitor: evaluation settings overriding defaultMonitor
         '''
+        settings=dict(defaultMonitor)
+        if monitor!=None:
+            settings.update(monitor)
         trainSize=trainSet['x'].shape[0]
         validateSize=validateSet['x'].shape[0]
         testSize=testSet['x'].shape[0]
@@ -252,20 +291,16 @@ class DRCNNModel(object):
         trainX=theano.shared(trainSet['x'],borrow=True)
         trainY=theano.shared(trainSet['y'],borrow=True)
         trainY=T.cast(trainY,'int32')
-        validateX=theano.shared(validateSet['x'],borrow=True)
-        validateY=theano.shared(validateSet['y'],borrow=True)
-        validateY=T.cast(validateY,'int32')
-        testX=testSet['x']
-        testY=np.asarray(testSet['y'],'int32')
         trainBatches=trainSize/self.batchSize
-        validateBatches=validateSize/self.batchSize
+        validateBatches=(validateSize+self.batchSize-1)/self.batchSize
+        testBatches=(testSize+self.batchSize-1)/self.batchSize
 
         index=T.iscalar('index')
         learnRate=T.dscalar('lr')
         stepSize=T.dscalar('lr')
 
         sgdTrainModel=theano.function(
-                [index,learnRate],self.cost,updates=self.update,
+                [index,learnRate],[self.cost,self.errorCount,self.classifier.predict],updates=self.update,
                 givens={
                     self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
                     self.y:trainY[index*self.batchSize:(index+1)*self.batchSize],
@@ -274,7 +309,7 @@ class DRCNNModel(object):
         print 'SGD TrainModel Constructed!'
 
         sgdMomentumTrainModel=theano.function(
-                [index,learnRate],self.cost,updates=self.sgdMomentumUpdate,
+                [index,learnRate],[self.cost,self.errorCount,self.classifier.predict],updates=self.sgdMomentumUpdate,
                 givens={
                     self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
                     self.y:trainY[index*self.batchSize:(index+1)*self.batchSize],
@@ -283,7 +318,7 @@ class DRCNNModel(object):
         print 'SGD-Momentum TrainModel Constructed!'
 
         adadeltaTrainModel=theano.function(
-                [index],self.cost,updates=self.adadeltaUpdate,
+                [index],[self.cost,self.errorCount,self.classifier.predict],updates=self.adadeltaUpdate,
                 givens={
                     self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
                     self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]}
@@ -291,7 +326,7 @@ class DRCNNModel(object):
         print 'Adadelta TrainModel Constructed!'
 
         adadeltaMomentumTrainModel=theano.function(
-                [index,stepSize],self.cost,updates=self.adadeltaMomentumUpdate,
+                [index,stepSize],[self.cost,self.errorCount,self.classifier.predict],updates=self.adadeltaMomentumUpdate,
                 givens={
                     self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
                     self.y:trainY[index*self.batchSize:(index+1)*self.batchSize],
@@ -299,31 +334,28 @@ class DRCNNModel(object):
                 )
         print 'Adadelta(with momentum) TrainModel Constructed!'
 
-        validateModel=theano.function(
-                [index],self.errors,
-                givens={
-                    self.x:validateX[index*self.batchSize:(index+1)*self.batchSize],
-                    self.y:validateY[index*self.batchSize:(index+1)*self.batchSize]}
-                )
-        print 'Validation Model Constructed!'
-
-        testTrain=theano.function(
-                [index],self.errors,
-                givens={
-                    self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
-                    self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]}
-                )
-        print 'Test Model on Training Set Constructed!'
+        if not settings['running']:
+            testTrain=theano.function(
+                    [index],self.errors,
+                    givens={
+                        self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
+                        self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]}
+                    )
+            print 'Test Model on Training Set Constructed!'
        
-        testLayer0Input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape((testSize,self.featureMaps,self.sentenceLen,self.wdim))
-        testLayer1Input=self.layer0.process(testLayer0Input,testSize)
-        testLayer2Input=self.layer1.process(testLayer1Input,testSize)
-        testLayer3Input=self.layer2.process(testLayer2Input,testSize)
-        testClassifierInput=self.layer3.process(testLayer3Input,testSize).flatten(2)
-        testPredict=self.classifier.predictInstance(testClassifierInput)
-        testError=T.mean(T.neq(testPredict,self.y))
-        testModel=theano.function([self.x,self.y],testError)
-        print 'Testing Model Constructed!'
+        evalLayer0Input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape((self.batchSize,self.featureMaps,self.sentenceLen,self.wdim))
+        evalLayer1Input=self.layer0.forward(evalLayer0Input,self.layer0.shape,False)
+        evalLayer2Input=self.layer1.forward(evalLayer1Input,self.layer1.shape,False)
+        evalLayer3Input=self.layer2.forward(evalLayer2Input,self.layer2.shape,False)
+        evalClassifierInput=self.layer3.forward(evalLayer3Input,self.layer3.shape,False).flatten(2)
+        evalPredict=self.classifier.predictInstance(evalClassifierInput)
+        evalModel=theano.function([self.x],evalPredict)
+        print 'Evaluation Model Constructed!'
+
+        evalBatches=max(1,settings['examples']/self.batchSize)
+        sampleBatches=range(validateBatches)
+        if 0<settings['validateBatches']<validateSize/self.batchSize:
+            sampleBatches=np.random.permutation(validateSize/self.batchSize)[:settings['validateBatches']]
 
         epoch=0
         learningRate=self.learningRate
@@ -341,23 +373,34 @@ class DRCNNModel(object):
         while epoch<nEpoch:
             epoch+=1
             num=0
+            runningError=[]
+            epochError=[]
+            lastEval=time.time()
 
             for minBatch in np.random.permutation(range(trainBatches)):
-                #cost=adadeltaTrainModel(minBatch)
-                cost=adadeltaMomentumTrainModel(minBatch,steppingSize)
+                #cost,errorCount,predict=adadeltaTrainModel(minBatch)
+                cost,errorCount,predict=adadeltaMomentumTrainModel(minBatch,steppingSize)
+                runningError.append(errorCount)
+                epochError.append(errorCount)
                 x=float(epoch)+float(num+1)/float(trainBatches)-1
                 self.costValues.append({'x':x,'value':cost})
-                if num%50==0:
-                    trainError=[testTrain(i) for i in xrange(trainBatches)]
-                    trainAcc=1-np.mean(trainError)
-                    validateError=[validateModel(i) for i in xrange(validateBatches)]
-                    validateAcc=1-np.mean(validateError)
+                if settings['seconds']>0:
+                    due=time.time()-lastEval>=settings['seconds']
+                else:
+                    due=num%evalBatches==0
+                if due:
+                    if settings['running']:
+                        trainAcc=1-float(np.sum(runningError))/(len(runningError)*self.batchSize)
+                    else:
+                        trainError=[testTrain(i) for i in xrange(trainBatches)]
+                        trainAcc=1-np.mean(trainError)
+                    validateAcc=evalPrecision(evalModel,validateSet,sampleBatches,self.batchSize)
                     self.trainAccs.append({'x':x,'acc':trainAcc})
                     self.validateAccs.append({'x':x,'acc':validateAcc})
                     print'Epoch=%i,TrainAcc=%f%%,ValidateAcc=%f%%'%(epoch,trainAcc*100.,validateAcc*100.)
 
                     if validateAcc>bestValAcc:
-                        testError=testModel(testX,testY)
+                        testError=1-evalPrecision(evalModel,testSet,xrange(testBatches),self.batchSize)
                         testAcc=1-testError
                         bestValAcc=validateAcc
                         bestTestAcc=max(bestTestAcc,testAcc)
@@ -374,19 +417,23 @@ class DRCNNModel(object):
                             print 'Learning Rate %f->%f'%(learningRate*10.,learningRate)
                             print 'stepping Size %f->%f'%(steppingRate*10.,steppingRate)
                     print 'BestValAcc=%f%%,BestTestAcc=%f%%,FinalAcc=%f%%'%(bestValAcc*100.,bestTestAcc*100.,finalAcc*100.)
+                    runningError=[]
+                    lastEval=time.time()
                 num+=1
 
             x=float(epoch)
-            trainError=[testTrain(i) for i in xrange(trainBatches)]
-            trainAcc=1-np.mean(trainError)
-            validateError=[validateModel(i) for i in xrange(validateBatches)]
-            validateAcc=1-np.mean(validateError)
+            if settings['running']:
+                trainAcc=1-float(np.sum(epochError))/(len(epochError)*self.batchSize)
+            else:
+                trainError=[testTrain(i) for i in xrange(trainBatches)]
+                trainAcc=1-np.mean(trainError)
+            validateAcc=evalPrecision(evalModel,validateSet,xrange(validateBatches),self.batchSize)
             self.trainAccs.append({'x':x,'acc':trainAcc})
             self.validateAccs.append({'x':x,'acc':validateAcc})
             print 'Epoch=%i,TrainAcc=%f%%,ValidateAcc=%f%%'%(epoch,trainAcc*100.,validateAcc*100.)
 
             if validateAcc>bestValAcc:
-                testError=testModel(testX,testY)
+                testError=1-evalPrecision(evalModel,testSet,xrange(testBatches),self.batchSize)
                 testAcc=1-testError
                 bestValAcc=validateAcc
                 bestTestAcc=max(bestTestAcc,testAcc)
@@ -412,3 +459,28 @@ class DRCNNModel(object):
         timeStruct=time.localtime(time.time())
         fileName=str(timeStruct.tm_mon)+'_'+str(timeStruct.tm_mday)+'_'+str(timeStruct.tm_hour)+'_'+str(timeStruct.tm_min)+'__'+str(self.result['finalAcc'])+'_'+self.name
         cPickle.dump([self.result,self.trainAccs,self.validateAccs,self.testAccs,self.costValues],open(savePath+fileName,'wb'))
+
+    def export(self,fileName):
+        '''
+        >>>dump the parameters, the architecture and the words of the rows to a *.npz file, loaded by numpyModel.NumpyDRCNNModel for inference without theano
+
+        >>>type fileName: str
+        >>>para fileName: *.npz file
+        '''
+        layers=[self.layer0,self.layer1,self.layer2,self.layer3]
+        arrays={
+            'pool':np.array([layer.pool for layer in layers]),
+            'dropout':np.array([layer.dropoutRate for layer in layers]),
+            'featureMaps':self.featureMaps,
+            'sentenceLen':self.sentenceLen,
+            'batchSize':self.batchSize,
+            'w':self.classifier.w.get_value(),
+            'b':self.classifier.b.get_value(),
+            'wordVec':self.wordVec.get_value()
+        }
+        if self.wordIndex!=None:
+            arrays['words']=wordArray(self.wordIndex,len(arrays['wordVec']))
+        for i,layer in enumerate(layers):
+            arrays['w_%d'%i]=layer.w.get_value()
+            arrays['b_%d'%i]=layer.b.get_value()
+        np.savez(fileName,**arrays)
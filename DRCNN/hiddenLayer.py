@@ -4,7 +4,7 @@ import theano
 import theano.tensor as T
 
 class HiddenLayer(object):
-	def __init__(self,rng,input,n_in,n_out,activation):
+	def __init__(self,rng,input,n_in,n_out,activation,dropoutRate=0.0):
 		'''
 		>>>type rng: numpy.random.RandomState
 		>>>para rng: initalize weight randomly
@@ -20,7 +20,13 @@ class HiddenLayer(object):
 
 		>>>type activation: func
 		>>>para activation: the activate function
+
+		>>>type dropoutRate: float
+		>>>para dropoutRate: dropout rate of the output, no dropout if 0
 		'''
+		self.rng=rng
+		self.activation=activation
+		self.dropoutRate=dropoutRate
 		self.input=input
 
 		w_bound=np.sqrt(6.0/(n_in+n_out))
@@ -37,14 +43,31 @@ class HiddenLayer(object):
 		b_value=np.zeros((n_out),dtype=theano.config.floatX)
 		self.b=theano.shared(value=b_value,name='b',borrow=True)
 
+		self.output=self.forward(input)
+
+		self.param=[self.w,self.b]
+
+	def forward(self,input,train=True):
+		'''
+		>>>output of input, sharing the weights of this layer
+
+		>>>type input: theano.tensor.TensorType
+		>>>para input: input data
+		>>>type train: boolean
+		>>>para train: drop units randomly if True, scale them by the keep rate otherwise
+		'''
 		raw_output=T.dot(input,self.w)+self.b
 
-		self.output=(
-			raw_output if activation is None
-			else activation(raw_output)
+		output=(
+			raw_output if self.activation is None
+			else self.activation(raw_output)
 			)
-
-		self.param=[self.w,self.b]
+		if self.dropoutRate>0:
+			if train:
+				output=dropout(self.rng,output,self.dropoutRate)
+			else:
+				output=output*(1.0-self.dropoutRate)
+		return output
 
 def dropout(rng,value,p):
 	'''
@@ -63,5 +86,4 @@ def dropout(rng,value,p):
 class DropoutHiddenLayer(HiddenLayer):
 	
 	def __init__(self,rng,input,n_in,n_out,activation,dropoutRate):
-		HiddenLayer.__init__(self,rng,input,n_in,n_out,activation)
-		self.output=dropout(rng,self.output,dropoutRate)
+		HiddenLayer.__init__(self,rng,input,n_in,n_out,activation,dropoutRate)
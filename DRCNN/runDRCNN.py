@@ -1,71 +1,80 @@
-import sys,warnings
+import os,sys,warnings
 import numpy as np
 
 from drcnnModel import *
 from loadWordVec import *
+from loadDataset import *
 
 warnings.filterwarnings('ignore')
 sys.setrecursionlimit(40000)
 
-def parseSentence(text,wordIndex,maxLen):
-	'''
-	>>>convert sentence to a matrix
-
-	>>>type text:string
-	>>>para text:raw text
-	>>>type wordIndex:dict
-	>>>para wordIndex:map word to its entry
-	>>>type maxLen:int
-	>>>para maxLen:maximum length of sentences in the whole set
-	'''
-	length=len(text)
-	padLeft=(maxLen-length+1)/2
-	padRight=(maxLen-length)/2
-	vec=[]
-
-	for i in xrange(padLeft):
-		vec.append(0)
-	for word in text:
-		vec.append(wordIndex[word])
-	for i in xrange(padRight):
-		vec.append(0)
-
-	assert len(vec)==maxLen
-	return vec
-
-def loadDatas(dataFile,wordVecFile='',dimension=300,rand=False):
+def loadDatas(dataFile,wordVecFile='',dimension=300,rand=False,cacheDir='',phrases=False,minFreq=1,maxVocab=0,vocabFile='',savedVocab=''):
 	'''
 	>>>load training/validate/test data and wordVec info
 
 	>>>type dataFile/wordVecFile: string
-	>>>para dataFile/wordVecFile: data and wordVec file
+	>>>para dataFile/wordVecFile: data (pickled list or compact *.npz) and wordVec file
 	>>>type dimension: int
 	>>>para dimension: the dimension of word embeddings
 	>>>type static: bool
 	>>>para static: static wordVec or not
+	>>>type cacheDir: str
+	>>>para cacheDir: folder of the filtered wordVec cache, no cache if empty
+	>>>type phrases: bool
+	>>>para phrases: train on the phrases of the *.npz dataset as well, only the data.npz of parseSST.py -phrases has them, the pickled data has none
+	>>>type minFreq/maxVocab: int
+	>>>para minFreq/maxVocab: document frequency cutoff and maximum size of the vocabulary, no cap if maxVocab is 0
+	>>>type vocabFile: str
+	>>>para vocabFile: *.npz file to save the vocabulary in, not saved if empty
+	>>>type savedVocab: str
+	>>>para savedVocab: reuse the vocabulary of this *.npz file written by an earlier run instead of minFreq/maxVocab, so that word ids stay the same
 	'''
-	fopen=open(dataFile,'rb')
-	data=cPickle.load(fopen)
-	fopen.close()
-	sentences,vocab,config=data
-		
-	wordVec=[]
-	if rand==False:
-		vectors,wordIndex=getWordVec(dataFile,wordVecFile)
+	if phrases and not dataFile.endswith('.npz'):
+		raise ValueError('-phrases needs data.npz, run parseSST.py -phrases and pass its data.npz instead of %s'%dataFile)
+	if dataFile.endswith('.npz'):
+		corpus,vocab,config=loadCompactData(dataFile,phrases)
+		sentences=None
 	else:
-		vectors,wordIndex=getRandWordVec(dataFile,dimension)
+		fopen=open(dataFile,'rb')
+		sentences,vocab,config=cPickle.load(fopen)
+		fopen.close()
 
-	return sentences,vocab,config,vectors,wordIndex
+	if savedVocab!='':
+		vocabulary=loadVocabulary(savedVocab,vocab)
+	else:
+		vocabulary=Vocabulary(vocab,minFreq,maxVocab)
+	if vocabFile!='':
+		vocabulary.save(vocabFile)
+	print 'vocabulary: %d words, %d left out'%(len(vocabulary),vocabulary.dropped)
+
+	if rand==False and cacheDir!='':
+		vectors,wordIndex=getCachedWordVec(vocabulary,wordVecFile,cacheDir)
+	elif rand==False:
+		vectors,wordIndex=vocabWordVec(vocabulary,wordVecFile)
+	else:
+		vectors,wordIndex=vocabRandWordVec(vocabulary,dimension)
+	#words left out of the vocabulary share the UNK row
+	if vocabulary.dropped>0:
+		vectors=addUnknownVec(vectors)
 
-def parseConfig(sentences,vocab,config,vectors,wordIndex,static,name):
+	if sentences==None:
+		corpus=remapCompactData(corpus,wordIndex,len(vectors))
+	else:
+		corpus=compactSentences(sentences,wordIndex,len(vectors))
+
+	return corpus,vocab,config,vectors,wordIndex
+
+def parseConfig(corpus,vocab,config,vectors,wordIndex,static,name,monitor=None):
 	'''
 	>>>load configs to generate model and train/validate/test batches
 
-	>>>sentences/vocab/config/vectors/wordIndex is the same in README.md file of each dataset
+	>>>vocab/config is the same in README.md file of each dataset, corpus is in the compact format of loadDataset.py
 	>>>type static:bool
 	>>>para static:whether or not to use static wordVec
 	>>>type name:str
 	>>>para name:the name of the model
+	>>>type monitor:dict
+	>>>para monitor:evaluation settings of train_validate_test, see defaultMonitor
 	'''
 	categories=config['classes']
 	sets=config['all']
@@ -76,81 +85,25 @@ def parseConfig(sentences,vocab,config,vectors,wordIndex,static,name):
 	dimension=len(vectors[0])
 	batchSize=25
 
-	maxLen=0
-	for sentence in sentences:
-		length=len(sentence['text'])
-		if length>maxLen:
-			maxLen=length
-
-	setMatrix={}
-	setClasses={}
-	for subset in sets:
-		setMatrix[subset]=[]
-		setClasses[subset]=[]
-
-	for sentence in sentences:
-		vec=parseSentence(sentence['text'],wordIndex,maxLen)
-		setLabel=sentence['setLabel']
-		category=sentence['label']
-		setMatrix[setLabel].append(vec)
-		setClasses[setLabel].append(category)
+	maxLen=int(corpus['len'].max())
+	matrix=encodeCorpus(corpus,maxLen)
+	labels=corpus['label']
+	setLabels=corpus['setLabel']
 
 	if cross==False:
-		trainSet={};trainSetX=[];trainSetY=[]
-		validateSet={};validationSetX=[];validationSetY=[]
-		testSet={};testSetX=[];testSetY=[]
-		for subset in train:
-			trainSetX+=setMatrix[subset]
-			trainSetY+=setClasses[subset]
-		for subset in validation:
-			validationSetX+=setMatrix[subset]
-			validationSetY+=setClasses[subset]
-		for subset in test:
-			testSetX+=setMatrix[subset]
-			testSetY+=setClasses[subset]
+		trainIndex=subsetIndex(setLabels,train)
+		validationIndex=subsetIndex(setLabels,validation)
+		testIndex=subsetIndex(setLabels,test)
 
 		if len(validation)==0:				#No ValidationSet
-			newTrainSetX=[];newValidationSetX=[]
-			newTrainSetY=[];newValidationSetY=[]
-			index=0
-
-			validateEachType=int(len(trainSetX)*0.1/categories)
-			validationType=[]
-			for i in xrange(categories):
-				validationType.append(0)
-
-			for i in np.random.permutation(range(len(trainSetX))):
-				Type=trainSetY[i]
-				if validationType[Type]<validateEachType:
-					newValidationSetX.append(trainSetX[i])
-					newValidationSetY.append(trainSetY[i])
-					validationType[Type]+=1
-				else:
-					newTrainSetX.append(trainSetX[i])
-					newTrainSetY.append(trainSetY[i])
-			trainSetX=newTrainSetX;validationSetX=newValidationSetX
-			trainSetY=newTrainSetY;validationSetY=newValidationSetY
-				
-		if len(trainSetX)%batchSize>0:
-			extraNum=batchSize-len(trainSetX)%batchSize
-			extraIndex=np.random.permutation(range(len(trainSetX)))
-			for i in xrange(extraNum):
-				trainSetX.append(trainSetX[extraIndex[i]])
-				trainSetY.append(trainSetY[extraIndex[i]])
+			trainIndex,validationIndex=splitValidation(trainIndex,labels,categories)
 
-		if len(validationSetX)%batchSize>0:
-			extraNum=batchSize-len(validationSetX)%batchSize
-			extraIndex=np.random.permutation(range(len(validationSetX)))
-			for i in xrange(extraNum):
-				validationSetX.append(validationSetX[extraIndex[i]])
-				validationSetY.append(validationSetY[extraIndex[i]])
+		trainIndex=fillBatches(trainIndex,batchSize)
+		validationIndex=fillBatches(validationIndex,batchSize)
 
-		trainSet['x']=np.array(trainSetX,dtype=theano.config.floatX)
-		trainSet['y']=np.array(trainSetY,dtype=theano.config.floatX)
-		validateSet['x']=np.array(validationSetX,dtype=theano.config.floatX)
-		validateSet['y']=np.array(validationSetY,dtype=theano.config.floatX)
-		testSet['x']=np.array(testSetX,dtype=theano.config.floatX)
-		testSet['y']=np.array(testSetY,dtype=theano.config.floatX)
+		trainSet=makeSet(matrix,labels,trainIndex)
+		validateSet=makeSet(matrix,labels,validationIndex)
+		testSet=makeSet(matrix,labels,testIndex)
 
                 network=DRCNNModel(
                     wordMatrix=vectors,
@@ -166,68 +119,27 @@ def parseConfig(sentences,vocab,config,vectors,wordIndex,static,name):
                     name=name
                     )
 
-		precision=network.train_validate_test(trainSet,validateSet,testSet,10)
+		network.wordIndex=wordIndex
+		precision=network.train_validate_test(trainSet,validateSet,testSet,10,monitor)
 		network.save()
+		network.export('../Models/%s.model.npz'%name)				#inference without theano by numpyModel.NumpyDRCNNModel
 		print 'Model '+name+' :Final Precision Rate %f%%'%(precision*100.)
 	else:
 		precisions=[]
 		for item in sets:
-			trainSet={};trainSetX=[];trainSetY=[]
-			validateSet={};validationSetX=[];validationSetY=[]
-			testSet={};testSetX=[];testSetY=[]
-			for subset in sets:
-				if item!=subset:
-					trainSetX+=setMatrix[subset]
-					trainSetY+=setClasses[subset]
-				else:
-					testSetX+=setMatrix[subset]
-					testSetY+=setClasses[subset]
+			trainIndex=subsetIndex(setLabels,[subset for subset in sets if subset!=item])
+			testIndex=subsetIndex(setLabels,[item])
 
 			#No ValidationSet
-			newTrainSetX=[];newValidationSetX=[]
-			newTrainSetY=[];newValidationSetY=[]
-			
-			validateEachType=int(len(trainSetX)*0.1/categories)
-			validationType=[]
-			for i in xrange(categories):
-				validationType.append(0)
-
-			for i in np.random.permutation(range(len(trainSetX))):
-				Type=trainSetY[i]
-				if validationType[Type]<validateEachType:
-					newValidationSetX.append(trainSetX[i])
-					newValidationSetY.append(trainSetY[i])
-					validationType[Type]+=1
-				else:
-					newTrainSetX.append(trainSetX[i])
-					newTrainSetY.append(trainSetY[i])
+			trainIndex,validationIndex=splitValidation(trainIndex,labels,categories)
 
-			trainSetX=newTrainSetX;validationSetX=newValidationSetX
-			trainSetY=newTrainSetY;validationSetY=newValidationSetY
+			trainIndex=fillBatches(trainIndex,batchSize)
+			validationIndex=fillBatches(validationIndex,batchSize)
 
+			trainSet=makeSet(matrix,labels,trainIndex)
+			validateSet=makeSet(matrix,labels,validationIndex)
+			testSet=makeSet(matrix,labels,testIndex)
 
-			if len(trainSetX)%batchSize>0:
-				extraNum=batchSize-len(trainSetX)%batchSize
-				extraIndex=np.random.permutation(range(len(trainSetX)))
-				for i in xrange(extraNum):
-					trainSetX.append(trainSetX[extraIndex[i]])
-					trainSetY.append(trainSetY[extraIndex[i]])
-
-			if len(validationSetX)%batchSize>0:
-				extraNum=batchSize-len(validationSetX)%batchSize
-				extraIndex=np.random.permutation(range(len(validationSetX)))
-				for i in xrange(extraNum):
-					validationSetX.append(validationSetX[extraIndex[i]])
-					validationSetY.append(validationSetY[extraIndex[i]])
-
-			trainSet['x']=np.array(trainSetX,dtype=theano.config.floatX)
-			trainSet['y']=np.array(trainSetY,dtype=theano.config.floatX)
-			validateSet['x']=np.array(validationSetX,dtype=theano.config.floatX)
-			validateSet['y']=np.array(validationSetY,dtype=theano.config.floatX)
-			testSet['x']=np.array(testSetX,dtype=theano.config.floatX)
-			testSet['y']=np.array(testSetY,dtype=theano.config.floatX)
-
-                        
                         network=DRCNNModel(
                             wordMatrix=vectors,
                             shape=(batchSize,1,maxLen,dimension),
@@ -242,8 +154,10 @@ def parseConfig(sentences,vocab,config,vectors,wordIndex,static,name):
                             name=name
                             )
                         
-			precision=network.train_validate_test(trainSet,validateSet,testSet,10)
+			network.wordIndex=wordIndex
+			precision=network.train_validate_test(trainSet,validateSet,testSet,10,monitor)
 			network.save()
+			network.export('../Models/%s_%d.model.npz'%(name,item))
 			precisions.append(precision)
 		print 'Model '+name+' :Final Precision Rate %f%%'%(np.mean(precisions)*100.)
 
@@ -253,6 +167,12 @@ if __name__=='__main__':
 	mode=0
 	dataFile=''
 	vecFile=''
+	cacheDir=None
+	phrases=False
+	minFreq=1
+	maxVocab=0
+	savedVocab=''
+	monitor={}
 	name='Model'
 
 	for i in xrange(len(sys.argv)):
@@ -264,6 +184,20 @@ if __name__=='__main__':
 			mode=2
 		elif sys.argv[i]=='-n':
 			mode=3
+		elif sys.argv[i]=='-c':
+			mode=4
+		elif sys.argv[i]=='-e':
+			mode=5
+		elif sys.argv[i]=='-s':
+			mode=6
+		elif sys.argv[i]=='-vs':
+			mode=7
+		elif sys.argv[i]=='-minfreq':
+			mode=8
+		elif sys.argv[i]=='-maxvocab':
+			mode=9
+		elif sys.argv[i]=='-vocab':
+			mode=10
 		else:
 			if mode==1:
 				dataFile=sys.argv[i]
@@ -274,6 +208,27 @@ if __name__=='__main__':
 			elif mode==3:
 				name=sys.argv[i]
 				mode=0
+			elif mode==4:
+				cacheDir=sys.argv[i]
+				mode=0
+			elif mode==5:
+				monitor['examples']=int(sys.argv[i])
+				mode=0
+			elif mode==6:
+				monitor['seconds']=float(sys.argv[i])
+				mode=0
+			elif mode==7:
+				monitor['validateBatches']=int(sys.argv[i])
+				mode=0
+			elif mode==8:
+				minFreq=int(sys.argv[i])
+				mode=0
+			elif mode==9:
+				maxVocab=int(sys.argv[i])
+				mode=0
+			elif mode==10:
+				savedVocab=sys.argv[i]
+				mode=0
 			else:
 				if sys.argv[i]=='-nonstatic':
 					static=False
@@ -283,9 +238,17 @@ if __name__=='__main__':
 					rand=True
 				elif sys.argv[i]=='-word2vec':
 					rand=False
+				elif sys.argv[i]=='-nocache':
+					cacheDir=''
+				elif sys.argv[i]=='-phrases':
+					phrases=True
+				elif sys.argv[i]=='-monitor':
+					monitor['running']=True
 				else:
 					raise NotImplementedError('command line error')
-	print 'config: dataFile:%s, vecFile:%s, static:%r, rand:%r'%(dataFile,vecFile,static,rand)
+	if cacheDir==None:
+		cacheDir=os.path.join(os.path.dirname(os.path.abspath(dataFile)),'wordVecCache')
+	print 'config: dataFile:%s, vecFile:%s, static:%r, rand:%r, cacheDir:%s, monitor:%r'%(dataFile,vecFile,static,rand,cacheDir,monitor)
 
 	saveFile='../Models/'+name
 	fwrite=open(saveFile,'w')
@@ -308,5 +271,5 @@ if __name__=='__main__':
 	fwrite.close()
 	print 'model '+name+' saved!'
 
-	sentences,vocab,config,vectors,wordIndex=loadDatas(dataFile=dataFile,wordVecFile=vecFile,dimension=300,rand=rand)
-	parseConfig(sentences,vocab,config,vectors,wordIndex,static,name)
+	corpus,vocab,config,vectors,wordIndex=loadDatas(dataFile=dataFile,wordVecFile=vecFile,dimension=300,rand=rand,cacheDir=cacheDir,phrases=phrases,minFreq=minFreq,maxVocab=maxVocab,vocabFile=saveFile+'.vocab.npz',savedVocab=savedVocab)
+	parseConfig(corpus,vocab,config,vectors,wordIndex,static,name,monitor)
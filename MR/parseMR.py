@@ -1,59 +1,299 @@
-import cPickle
+import cPickle,os,sys,time
+import multiprocessing
+import collections,zlib
 import re
 import numpy as np
 
 from collections import defaultdict
 
+#bytes outside [A-Za-z0-9(),!?'`] become spaces, one byte at a time like the original re.sub
+keepChars=set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789(),!?\'`')
+spaceTable=''.join(chr(i) if chr(i) in keepChars else ' ' for i in xrange(256))
+#contractions are split off and punctuation is padded with spaces in the same pass
+splitPattern=re.compile(r"\'s|\'ve|n\'t|\'re|\'d|\'ll|[,!()?]")
+splitMap={
+	"'s":" 's","'ve":" 've","n't":" n't","'re":" 're","'d":" 'd","'ll":" 'll",
+	',':' , ','!':' ! ','(':' \\( ',')':' \\) ','?':' \\? '
+}
+spacePattern=re.compile(r"\s{2,}")
+
 def cleanStr(string):
-	string=re.sub(r"[^A-Za-z0-9(),!?\'\`]"," ",string)
-	string=re.sub(r"\'s"," \'s",string)
-	string=re.sub(r"\'ve"," \'ve",string)
-	string=re.sub(r"n\'t"," n\'t",string)
-	string=re.sub(r"\'re"," \'re",string)
-	string=re.sub(r"\'d"," \'d",string)
-	string=re.sub(r"\'ll"," \'ll",string)
-	string=re.sub(r","," , ",string)
-	string=re.sub(r"!"," ! ",string)
-	string=re.sub(r"\("," \( ",string)
-	string=re.sub(r"\)"," \) ",string)
-	string=re.sub(r"\?"," \? ",string)
-	string=re.sub(r"\s{2,}"," ",string)
+	'''
+	>>>tokenize a sentence with precompiled patterns, the result is the same as the chain of re.sub calls it replaces
+	'''
+	string=string.translate(spaceTable)
+	string=splitPattern.sub(lambda match:splitMap[match.group()],string)
+	string=spacePattern.sub(' ',string)
 	return string.strip().lower()
 
-def loadSentences(positiveFile,negativeFile):
+def cleanLines(lines):
+	'''
+	>>>tokenize a chunk of lines, the unit of work of the worker processes
+	'''
+	return [cleanStr(line) for line in lines]
+
+def chunkLines(lines,chunkSize):
+	'''
+	>>>group an iterable of lines into lists of chunkSize lines
+	'''
+	chunk=[]
+	for line in lines:
+		chunk.append(line)
+		if len(chunk)==chunkSize:
+			yield chunk
+			chunk=[]
+	if len(chunk)>0:
+		yield chunk
+
+def cleanStream(lines,workers=1,chunkSize=2000,clean=cleanLines,initializer=None,initargs=()):
+	'''
+	>>>tokenize an iterable of lines in chunks, in worker processes if workers>1, yield the results in input order and report lines per second at the end
+	>>>at most 2*workers chunks are in flight, so memory stays bounded however long the input is
+
+	>>>type lines: iterable of str
+	>>>para lines: raw sentences, e.g. an open file
+	>>>type workers: int
+	>>>para workers: num of worker processes
+	>>>type chunkSize: int
+	>>>para chunkSize: num of lines sent to a worker at a time
+	>>>type clean: function
+	>>>para clean: maps a chunk of lines to a list of results, defined at module level so that workers can unpickle it
+	>>>type initializer/initargs: function/tuple
+	>>>para initializer/initargs: called with initargs in each worker, or once in this process if workers==1
+	'''
+	start=time.time()
+	num=0
+	if workers>1:
+		pool=multiprocessing.Pool(workers,initializer,initargs)
+	else:
+		pool=None
+		if initializer!=None:
+			initializer(*initargs)
+	pending=collections.deque()
+	for chunk in chunkLines(lines,chunkSize):
+		num+=len(chunk)
+		if pool==None:
+			results=clean(chunk)
+		else:
+			pending.append(pool.apply_async(clean,(chunk,)))
+			if len(pending)<2*workers:
+				continue
+			results=pending.popleft().get()
+		for result in results:
+			yield result
+	while len(pending)>0:
+		for result in pending.popleft().get():
+			yield result
+	if pool!=None:
+		pool.close()
+		pool.join()
+	seconds=time.time()-start
+	print '%d lines tokenized in %fs, %f lines/sec'%(num,seconds,num/max(seconds,1e-6))
+
+def loadSentences(positiveFile,negativeFile,workers=1):
 	sentences=[]
 	vocab=defaultdict(float)
-	poslines=[];neglines=[]
 	with open(positiveFile,'r') as fopen:
-		for line in fopen:
-			poslines.append(line)
+		poslines=list(cleanStream(fopen,workers))
 	posNum=len(poslines)
 	rand=np.random.permutation(range(posNum))
 	for i in xrange(posNum):
-		clean=cleanStr(poslines[rand[i]])
+		clean=poslines[rand[i]]
 		words=set(clean.split())
 		for word in words:
 			vocab[word]+=1
 		sentences.append({'label':0,'text':clean.split(),'setLabel':i%10,'len':len(clean.split())})
 
 	with open(negativeFile,'r') as fopen:
-		for line in fopen:
-			neglines.append(line)
+		neglines=list(cleanStream(fopen,workers))
 	negNum=len(neglines)
 	rand=np.random.permutation(range(negNum))
 	for i in xrange(negNum):
-		clean=cleanStr(neglines[rand[i]])
+		clean=neglines[rand[i]]
 		words=set(clean.split())
 		for word in words:
 			vocab[word]+=1
 		sentences.append({'label':1,'text':clean.split(),'setLabel':i%10,'len':len(clean.split())})
 	return sentences,vocab
 
+def streamSentences(positiveFile,negativeFile,writer,workers=1,folds=10):
+	'''
+	>>>read, tokenize and append the sentences to writer line by line, the subset of a sentence is a hash of its text, so no permutation of the corpus is needed
+
+	>>>type positiveFile/negativeFile: str
+	>>>para positiveFile/negativeFile: raw sentences of each category
+	>>>type writer: CompactWriter
+	>>>para writer: the dataset on disk
+	>>>type workers: int
+	>>>para workers: num of tokenizing processes
+	>>>type folds: int
+	>>>para folds: num of cross-validation subsets
+	'''
+	for fileName,label in [(positiveFile,0),(negativeFile,1)]:
+		with open(fileName,'r') as fopen:
+			for clean in cleanStream(fopen,workers):
+				#the same sentence always falls into the same subset
+				setLabel=(zlib.crc32(clean)&0xffffffff)%folds
+				writer.append(clean.split(),label,setLabel)
+
+def saveCompact(sentences,vocab,config,fileName):
+	'''
+	>>>save the dataset as flat arrays: word ids of all sentences concatenated with their offsets, and per-sentence label/setLabel/len
+
+	>>>type sentences: list
+	>>>para sentences: each entry is {'label','text','setLabel','len'}
+	>>>type vocab: dict
+	>>>para vocab: document frequency of each word
+	>>>type config: dict
+	>>>para config: config information of the dataset
+	>>>type fileName: str
+	>>>para fileName: *.npz file
+	'''
+	words=['']+vocab.keys()
+	wordId={}
+	for i in xrange(1,len(words)):
+		wordId[words[i]]=i
+	lengths=np.array([len(sentence['text']) for sentence in sentences],dtype='int32')
+	offsets=np.zeros(len(sentences)+1,dtype='int64')
+	offsets[1:]=np.cumsum(lengths)
+	tokens=np.fromiter(
+		(wordId[word] for sentence in sentences for word in sentence['text']),
+		dtype='int32',count=offsets[-1]
+	)
+	np.savez(fileName,
+		tokens=tokens,
+		offsets=offsets,
+		label=np.array([sentence['label'] for sentence in sentences],dtype='int32'),
+		setLabel=np.array([sentence['setLabel'] for sentence in sentences],dtype='int32'),
+		len=lengths,
+		words=np.array(words),
+		docFreq=np.array([0.]+[vocab[word] for word in words[1:]]),
+		classes=config['classes'],
+		all=np.array(config['all'],dtype='int32'),
+		train=np.array(config['train'],dtype='int32'),
+		test=np.array(config['test'],dtype='int32'),
+		dev=np.array(config['dev'],dtype='int32'),
+		cross=config['cross']
+	)
+
+class CompactWriter(object):
+	'''
+	>>>write a dataset in the format of saveCompact sentence by sentence, token ids and per-sentence fields go to temporary files on disk
+	>>>only the vocabulary is kept in memory, word ids are given in order of first occurrence
+	'''
+	def __init__(self,fileName):
+		'''
+		>>>type fileName: str
+		>>>para fileName: *.npz file
+		'''
+		self.fileName=fileName
+		self.tokenFile=open(fileName+'.tokens.tmp','wb')
+		self.fieldFile=open(fileName+'.fields.tmp','wb')
+		self.words=['']
+		self.docFreq=[0.]
+		self.wordId={}
+		self.num=0
+
+	def append(self,words,label,setLabel):
+		'''
+		>>>append one sentence given as a list of words
+		'''
+		ids=np.empty(len(words),dtype='int32')
+		for i in xrange(len(words)):
+			word=words[i]
+			if word not in self.wordId:
+				self.wordId[word]=len(self.words)
+				self.words.append(word)
+				self.docFreq.append(0.)
+			ids[i]=self.wordId[word]
+		for wordId in set(ids.tolist()):
+			self.docFreq[wordId]+=1
+		ids.tofile(self.tokenFile)
+		np.array([label,setLabel,len(words)],dtype='int32').tofile(self.fieldFile)
+		self.num+=1
+
+	def written(self):
+		'''
+		>>>token ids and offsets of the sentences appended so far, the token ids are mapped from the temporary file
+		'''
+		self.tokenFile.flush()
+		self.fieldFile.flush()
+		fields=np.fromfile(self.fileName+'.fields.tmp',dtype='int32').reshape(-1,3)
+		if os.path.getsize(self.fileName+'.tokens.tmp')>0:
+			tokens=np.memmap(self.fileName+'.tokens.tmp',dtype='int32',mode='r')
+		else:
+			tokens=np.zeros(0,dtype='int32')
+		offsets=np.zeros(len(fields)+1,dtype='int64')
+		offsets[1:]=np.cumsum(fields[:,2])
+		return tokens,offsets,fields
+
+	def close(self,config,labels=None,setLabels=None,phrases=None):
+		'''
+		>>>assemble the *.npz file from the temporary files and remove them
+
+		>>>type config: dict
+		>>>para config: config information of the dataset
+		>>>type labels: list or np.array
+		>>>para labels: category of each sentence, replacing the labels given to append if not None
+		>>>type setLabels: list or np.array
+		>>>para setLabels: subset ID of each sentence, replacing the ones given to append if not None
+		>>>type phrases: dict
+		>>>para phrases: phrase spans in the format of SST1/parseSST.py phraseSpans, saved along with the sentences if not None
+		'''
+		tokens,offsets,fields=self.written()
+		self.tokenFile.close()
+		self.fieldFile.close()
+		arrays=dict(
+			tokens=tokens,
+			offsets=offsets,
+			label=fields[:,0] if labels is None else np.asarray(labels,dtype='int32'),
+			setLabel=fields[:,1].copy() if setLabels is None else np.asarray(setLabels,dtype='int32'),
+			len=fields[:,2].copy(),
+			words=np.array(self.words),
+			docFreq=np.array(self.docFreq),
+			classes=config['classes'],
+			all=np.array(config['all'],dtype='int32'),
+			train=np.array(config['train'],dtype='int32'),
+			test=np.array(config['test'],dtype='int32'),
+			dev=np.array(config['dev'],dtype='int32'),
+			cross=config['cross']
+		)
+		if phrases!=None:
+			arrays.update(phrases)
+		np.savez(self.fileName,**arrays)
+		del tokens,arrays
+		os.remove(self.fileName+'.tokens.tmp')
+		os.remove(self.fileName+'.fields.tmp')
+
 path='./'
 
 if __name__=='__main__':
+	mode=0
+	workers=1
+	stream=False
+	for i in xrange(len(sys.argv)):
+		if i==0:
+			continue
+		if sys.argv[i]=='-w':
+			mode=1
+		else:
+			if mode==1:
+				workers=int(sys.argv[i])
+				mode=0
+			elif sys.argv[i]=='-stream':
+				stream=True
+			else:
+				raise NotImplementedError('command line error')
+
 	positiveFile=path+'rt-polarity.pos'
 	negativeFile=path+'rt-polarity.neg'
-	sentences,vocab=loadSentences(positiveFile,negativeFile)
-	cPickle.dump([sentences,vocab,{'classes':2,'all':range(10),'train':[],'test':[],'dev':[],'cross':True}],open('data','wb'))
+	config={'classes':2,'all':range(10),'train':[],'test':[],'dev':[],'cross':True}
+	if stream:
+		writer=CompactWriter('data.npz')
+		streamSentences(positiveFile,negativeFile,writer,workers)
+		writer.close(config)
+	else:
+		sentences,vocab=loadSentences(positiveFile,negativeFile,workers)
+		cPickle.dump([sentences,vocab,config],open('data','wb'))
+		saveCompact(sentences,vocab,config,'data.npz')
 	print 'data processed'
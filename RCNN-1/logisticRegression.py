@@ -29,26 +29,43 @@ class LogisticRegression(object):
 			)
 		self.param=[self.w,self.b]
 
-		self.output=softmax(T.dot(input,self.w)+self.b)
+		self.output=self.forward(input)
 		self.predict=T.argmax(self.output,axis=1)
 
-	def negative_log_likelyhood(self,y):
+	def negative_log_likelyhood(self,y,output=None):
 		'''
 		>>>calculate the negative log_likelyhood given labels of instances
 
 		>>>type y: T.ivector
 		>>>para y: right labels of instances
+		>>>type output: T.matrix
+		>>>para output: class probabilities from forward(), self.output if None
 		'''
-		return -T.mean(T.log(self.output)[T.arange(y.shape[0]),y])
+		if output is None:
+			output=self.output
+		return -T.mean(T.log(output)[T.arange(y.shape[0]),y])
 
-	def errors(self,y):
+	def errors(self,y,output=None):
 		'''
 		>>>calculate the error rate of test instances
 
 		>>>type y: T.ivector
 		>>>para y: right labels of instances
+		>>>type output: T.matrix
+		>>>para output: class probabilities from forward(), self.output if None
 		'''
-		return T.mean(T.neq(self.predict,y))
+		if output is None:
+			return T.mean(T.neq(self.predict,y))
+		return T.mean(T.neq(T.argmax(output,axis=1),y))
+
+	def forward(self,input):
+		'''
+		>>>class probabilities of input, sharing the weights of this layer
+
+		>>>type input: T.matrix
+		>>>para input: input data
+		'''
+		return softmax(T.dot(input,self.w)+self.b)
 
 	def predictInstance(self,data):
 		'''
@@ -57,6 +74,5 @@ class LogisticRegression(object):
 		>>>type data:T.tensor4
 		>>>para data:newly come data
 		'''
-		p=softmax(T.dot(data,self.w)+self.b)
-		return T.argmax(p,axis=1)
+		return T.argmax(self.forward(data),axis=1)
 		
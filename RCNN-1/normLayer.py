@@ -7,6 +7,8 @@ class NormLayer(object):
 	
 	def __init__(self,input,shape,alpha,beta,N):
 		'''
+		>>>local response normalization across channels, the window sum of squares is the difference of two cumulative sums
+
 		>>>type input: T.tensor4
 		>>>para input: input tensor
 
@@ -14,24 +16,14 @@ class NormLayer(object):
 		>>>para shape: (batch_size,features,height,width)
 
 		>>>type alpha/beta/N: float/float/int
-		>>>para alpha/beta/N: normalization factors
+		>>>para alpha/beta/N: normalization factors, N is the num of neighbouring channels in the window
 		'''
-		
-		#tmp=input.dimshuffle(1,0,2,3)
-		#self.output=T.zeros_like(tmp)
-		#for k in xrange(shape[1]):
-		#	result=T.sum(T.square(tmp[k-N/2:k+N/2]),axis=0)
-		#	norm=(1.0+alpha/N*result)**beta
-		#	self.output=T.set_subtensor(self.output[k],tmp[k]/norm)
-		#self.output=self.output.dimshuffle(1,0,2,3)
-
 		half=N//2
 		sq=T.sqr(input)
 		batchSize,features,height,width=shape
-		extra_channels=T.alloc(0.,batchSize+2*half,features,height,width)
-		sq=T.set_subtensor(extra_channels[half:half+batchSize,:,:,:], sq)
-		scale=1
-		for i in xrange(N):
-			scale+=alpha*sq[i:i+batchSize,:,:,:]
-		scale=scale**beta
+		#channel k is normalized by channels k-half...k-half+N-1, a leading zero makes each window sum cumsum[k+N]-cumsum[k]
+		padded=T.alloc(np.cast[theano.config.floatX](0.),batchSize,features+N,height,width)
+		padded=T.set_subtensor(padded[:,half+1:half+1+features,:,:],sq)
+		total=T.cumsum(padded,axis=1)
+		scale=(1+alpha*(total[:,N:,:,:]-total[:,:features,:,:]))**beta
 		self.output=input/scale
@@ -0,0 +1,169 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+def ReLU(x):
+	return np.maximum(x,0)
+
+def convValid(data,filters):
+	'''
+	>>>valid convolution of a batch of images, the same as conv.conv2d, computed as im2col and one matrix product
+
+	>>>type data: np.array
+	>>>para data: (batch_size,num of input feature maps, image height, image width)
+	>>>type filters: np.array
+	>>>para filters: (num of filters, num of input feature maps, filter height, filter width)
+	'''
+	batchSize,channels,height,width=data.shape
+	features,channels,filterHeight,filterWidth=filters.shape
+	outHeight=height-filterHeight+1
+	outWidth=width-filterWidth+1
+	data=np.ascontiguousarray(data)
+	strides=data.strides
+	#every (filterHeight,filterWidth) window of each channel as a view, without copying
+	columns=as_strided(
+		data,
+		shape=(batchSize,outHeight,outWidth,channels,filterHeight,filterWidth),
+		strides=(strides[0],strides[2],strides[3],strides[1],strides[2],strides[3])
+	)
+	kernels=filters[:,:,::-1,::-1].reshape(features,-1)
+	output=np.dot(columns.reshape(batchSize*outHeight*outWidth,-1),kernels.T)
+	return output.reshape(batchSize,outHeight,outWidth,features).transpose(0,3,1,2)
+
+def convSame(data,filters):
+	'''
+	>>>convolution whose output has the same height and width as data, the same as recurrentConvLayer.sameConv
+
+	>>>type data: np.array
+	>>>para data: (batch_size,num of input feature maps, image height, image width)
+	>>>type filters: np.array
+	>>>para filters: (num of filters, num of input feature maps, filter height, filter width)
+	'''
+	filterHeight,filterWidth=filters.shape[2:]
+	padded=np.pad(data,((0,0),(0,0),(filterHeight/2,filterHeight/2),(filterWidth/2,filterWidth/2)),'constant')
+	output=convValid(padded,filters)
+	return output[:,:,1-filterHeight%2:,1-filterWidth%2:]
+
+def localNorm(data,alpha,beta,N):
+	'''
+	>>>local response normalization across channels, the same as normLayer.NormLayer
+
+	>>>type data: np.array
+	>>>para data: (batch_size,features,height,width)
+	>>>type alpha/beta/N: float/float/int
+	>>>para alpha/beta/N: normalization factors
+	'''
+	half=N//2
+	features=data.shape[1]
+	padded=np.zeros((data.shape[0],features+N)+data.shape[2:],dtype=data.dtype)
+	padded[:,half+1:half+1+features]=np.square(data)
+	total=np.cumsum(padded,axis=1)
+	return data/(1+alpha*(total[:,N:]-total[:,:features]))**beta
+
+def maxPool(data,pool):
+	'''
+	>>>non-overlapping max pooling, the border that does not fill a window is ignored
+
+	>>>type data: np.array
+	>>>para data: (batch_size,features,height,width)
+	>>>type pool: tuple or list of length 2
+	>>>para pool: pooling size
+	'''
+	batchSize,features,height,width=data.shape
+	outHeight=height/pool[0]
+	outWidth=width/pool[1]
+	data=data[:,:,:outHeight*pool[0],:outWidth*pool[1]]
+	return data.reshape(batchSize,features,outHeight,pool[0],outWidth,pool[1]).max(axis=5).max(axis=3)
+
+def softmax(data):
+	exp=np.exp(data-data.max(axis=1,keepdims=True))
+	return exp/exp.sum(axis=1,keepdims=True)
+
+def wordArray(wordIndex,rows):
+	'''
+	>>>the word of each row of the embedding matrix, saved with a model so that raw sentences can be encoded, the rows of padding, UNK and hash buckets have none
+
+	>>>type wordIndex: dict
+	>>>para wordIndex: map word to its row
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix
+	'''
+	words=['']*rows
+	for word,index in wordIndex.items():
+		words[index]=word
+	return np.array(words)
+
+def wordIndexOf(words):
+	'''
+	>>>map word to its row from an array saved by wordArray
+	'''
+	words=words.tolist()
+	return dict((words[i],i) for i in xrange(1,len(words)) if words[i]!='')
+
+class NumpyRCNNModel(object):
+
+	def __init__(self,fileName):
+		'''
+		>>>load a model exported by RCNNModel.export, only numpy is needed for inference
+
+		>>>type fileName: str
+		>>>para fileName: *.npz file
+		'''
+		data=np.load(fileName)
+		self.filters=data['filters'].tolist()
+		self.time=int(data['time'])
+		self.alpha=float(data['alpha']);self.beta=float(data['beta']);self.N=int(data['N'])
+		self.dropout=data['dropout'].tolist()
+		self.sentenceLen=int(data['sentenceLen'])
+		self.batchSize=int(data['batchSize'])
+		self.wordIndex=wordIndexOf(data['words']) if 'words' in data.files else None		#map word to its row, None for models exported without it
+		self.w=data['w'];self.b=data['b']
+		self.wordVec=data['wordVec']
+		self.layers=[
+			(data['w_in_%d'%i],data['w_r_%d'%i],data['b_%d'%i],data['b_r_%d'%i])
+			for i in xrange(len(self.filters))
+		]
+
+	def forward(self,matrix):
+		'''
+		>>>class probabilities of a batch of sentences, the same computation as the inference graph of RCNNModel
+
+		>>>type matrix: np.array
+		>>>para matrix: word entries of the sentences, e.g. from loadDataset.encodeCorpus
+		'''
+		input=self.wordVec[np.asarray(matrix,dtype='int32')][:,None,:,:]
+		layer1Inputs=[]
+		for (w_in,w_r,b,b_r),dropout in zip(self.layers,self.dropout):
+			conv_input=convValid(input,w_in)
+			state=conv_input+b_r[None,:,None,None]
+			for i in xrange(self.time):
+				state=localNorm(ReLU(conv_input+convSame(state,w_r)),self.alpha,self.beta,self.N)
+			output=maxPool(state,(state.shape[2],1))+b[None,:,None,None]
+			layer1Inputs.append((output*(1.0-dropout)).reshape(len(matrix),-1))
+		return softmax(np.dot(np.concatenate(layer1Inputs,1),self.w)+self.b)
+
+	def probabilities(self,matrix,batchSize=100):
+		'''
+		>>>class probabilities of sentences, batchSize sentences at a time
+
+		>>>type matrix: np.array
+		>>>para matrix: word entries of the sentences, e.g. from loadDataset.encodeCorpus
+		>>>type batchSize: int
+		>>>para batchSize: num of sentences in each forward pass
+		'''
+		if len(matrix)==0:
+			return np.zeros((0,len(self.b)),dtype=self.w.dtype)
+		return np.concatenate([
+			self.forward(matrix[start:start+batchSize])
+			for start in xrange(0,len(matrix),batchSize)
+		])
+
+	def predict(self,matrix,batchSize=100):
+		'''
+		>>>predicted labels of sentences, the same as LogisticRegression.predictInstance
+
+		>>>type matrix: np.array
+		>>>para matrix: word entries of the sentences, e.g. from loadDataset.encodeCorpus
+		>>>type batchSize: int
+		>>>para batchSize: num of sentences in each forward pass
+		'''
+		return np.argmax(self.probabilities(matrix,batchSize),axis=1)
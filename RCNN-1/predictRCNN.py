@@ -0,0 +1,152 @@
+import os,sys,time
+import warnings
+import numpy as np
+
+from numpyModel import NumpyRCNNModel
+from loadWordVec import *
+from loadDataset import *
+
+#raw sentences are tokenized by the same code as the training data of MR
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','MR'))
+from parseMR import cleanStr
+
+warnings.filterwarnings('ignore')
+sys.setrecursionlimit(40000)
+
+def loadModel(fileName,useNumpy=False):
+	'''
+	>>>load a model for prediction: a checkpoint of RCNNModel, rebuilt and compiled with theano, or a model exported by RCNNModel.export, run by numpy only
+
+	>>>type fileName: str
+	>>>para fileName: checkpoint file, or *.npz file written by export if useNumpy
+	>>>type useNumpy: bool
+	>>>para useNumpy: use numpyModel.NumpyRCNNModel, theano is not imported
+	'''
+	if useNumpy:
+		network=NumpyRCNNModel(fileName)
+	else:
+		import rcnnModel
+		network=rcnnModel.loadRCNNModel(fileName)
+		network.compileEval(network.sentenceLen)
+	if network.wordIndex==None:
+		raise ValueError('the model %s has no word index'%fileName)
+	return network
+
+def embeddingRows(network):
+	'''
+	>>>num of rows of the embedding matrix of a RCNNModel or a NumpyRCNNModel
+	'''
+	if isinstance(network,NumpyRCNNModel):
+		return network.wordVec.shape[0]
+	return network.wordVec.get_value(borrow=True).shape[0]
+
+def encodeLines(lines,wordIndex,maxLen,rows):
+	'''
+	>>>tokenize raw sentences and convert them to a centered matrix of word entries, long sentences are cut to maxLen
+	>>>unknown words are mapped by wordEntries: to the UNK row or a hash bucket, or dropped for models trained without them
+
+	>>>type lines: list of str
+	>>>para lines: raw sentences
+	>>>type wordIndex: dict
+	>>>para wordIndex: map word to its entry
+	>>>type maxLen: int
+	>>>para maxLen: padded length of the model
+	>>>type rows: int
+	>>>para rows: num of rows of the embedding matrix
+	'''
+	sentences=[wordEntries(cleanStr(line).split(),wordIndex,rows)[:maxLen] for line in lines]
+	lengths=np.array([len(sentence) for sentence in sentences],dtype='int32')
+	offsets=np.zeros(len(sentences)+1,dtype='int64')
+	offsets[1:]=np.cumsum(lengths)
+	corpus={
+		'tokens':np.array([index for sentence in sentences for index in sentence],dtype='int32'),
+		'offsets':offsets,
+		'len':lengths
+	}
+	return encodeCorpus(corpus,maxLen)
+
+def predict(network,fin,fout,chunkSize):
+	'''
+	>>>classify the sentences of fin chunk by chunk, write the label and class probabilities of each line to fout
+
+	>>>type network: RCNNModel or NumpyRCNNModel
+	>>>para network: model loaded by loadModel
+	>>>type fin/fout: file
+	>>>para fin/fout: one raw sentence per line/one prediction per line
+	>>>type chunkSize: int
+	>>>para chunkSize: num of lines read at a time, rounded up to a multiple of the batch size
+	'''
+	chunkSize=(chunkSize+network.batchSize-1)/network.batchSize*network.batchSize
+	total=0
+	start=time.time()
+	lines=[]
+	for line in fin:
+		lines.append(line)
+		if len(lines)==chunkSize:
+			total+=writeChunk(network,lines,fout)
+			lines=[]
+	if len(lines)>0:
+		total+=writeChunk(network,lines,fout)
+	seconds=time.time()-start
+	sys.stderr.write('%d sentences in %fs, %f sentences/sec\n'%(total,seconds,total/max(seconds,1e-6)))
+
+def writeChunk(network,lines,fout):
+	probabilities=network.probabilities(encodeLines(lines,network.wordIndex,network.sentenceLen,embeddingRows(network)))
+	for label,probability in zip(np.argmax(probabilities,axis=1),probabilities):
+		fout.write('%d\t%s\n'%(label,' '.join(['%f'%p for p in probability])))
+	fout.flush()
+	return len(lines)
+
+if __name__=='__main__':
+	mode=0
+	modelFile=''
+	inputFile=''
+	outputFile=''
+	chunkSize=1000
+	useNumpy=False
+
+	for i in xrange(len(sys.argv)):
+		if i==0:
+			continue
+		if sys.argv[i]=='-m':
+			mode=1
+		elif sys.argv[i]=='-i':
+			mode=2
+		elif sys.argv[i]=='-o':
+			mode=3
+		elif sys.argv[i]=='-b':
+			mode=4
+		else:
+			if mode==1:
+				modelFile=sys.argv[i]
+				mode=0
+			elif mode==2:
+				inputFile=sys.argv[i]
+				mode=0
+			elif mode==3:
+				outputFile=sys.argv[i]
+				mode=0
+			elif mode==4:
+				chunkSize=int(sys.argv[i])
+				mode=0
+			else:
+				if sys.argv[i]=='-numpy':
+					useNumpy=True
+				else:
+					raise NotImplementedError('command line error')
+	if modelFile=='':
+		print 'Usage: python predictRCNN.py -m <checkpoint, or exported model with -numpy> [-numpy] [-i <input file>] [-o <output file>] [-b <lines per chunk>]'
+		exit(0)
+
+	#model messages go to stderr, so that stdout only carries predictions
+	stdout=sys.stdout
+	sys.stdout=sys.stderr
+	network=loadModel(modelFile,useNumpy)
+
+	fin=open(inputFile,'r') if inputFile!='' else sys.stdin
+	fout=open(outputFile,'w') if outputFile!='' else stdout
+	predict(network,fin,fout,chunkSize)
+	if fin!=sys.stdin:
+		fin.close()
+	if fout!=stdout:
+		fout.close()
@@ -1,4 +1,4 @@
-import cPickle,sys
+import cPickle,os,sys
 import time
 import numpy as np
 import theano
@@ -10,9 +10,17 @@ from hiddenLayer import *
 from logisticRegression import *
 from normLayer import *
 from recurrentConvLayer import *
+from numpyModel import NumpyRCNNModel,wordArray,wordIndexOf
 
 sys.setrecursionlimit(40000)
 
+defaultMonitor={
+	'running':False,		#train precision averaged over the trained minibatches instead of a pass over the training set
+	'examples':1250,		#evaluate every this many training examples
+	'seconds':0,			#evaluate every this many seconds instead, if positive
+	'validateBatches':0		#num of validation minibatches sampled once for evaluations within an epoch, all if 0
+}
+
 def ReLU(x):
 	return T.switch(x<0,0,x)
 
@@ -21,7 +29,46 @@ def as_floatX(variable):
 		return np.cast[theano.config.floatX](variable)
 	return T.cast(variable,theano.config.floatX)
 
-def AdadeltaUpdate(params,cost,rho=0.95,epsilon=1e-6,norm_lim=9):
+def evalPrecision(evalModels,dataSets,batches,batchSize):
+	'''
+	>>>precision of the given minibatches, each evaluated by the function of its bucket, the last partial minibatch of a set is padded with zeros
+
+	>>>type evalModels: list
+	>>>para evalModels: function mapping a minibatch of sentences to class probabilities, one for each bucket
+	>>>type dataSets: list of dict
+	>>>para dataSets: {'x','y'} set of each bucket
+	>>>type batches: list of tuple
+	>>>para batches: (bucket,minibatch index) to evaluate
+	>>>type batchSize: int
+	>>>para batchSize: minibatch size the functions are compiled with
+	'''
+	errors=0
+	num=0
+	for bucket,i in batches:
+		x=dataSets[bucket]['x'][i*batchSize:(i+1)*batchSize]
+		y=dataSets[bucket]['y'][i*batchSize:(i+1)*batchSize]
+		if len(y)<batchSize:
+			x=np.concatenate([x,np.zeros((batchSize-len(y),x.shape[1]),dtype=x.dtype)])
+		errors+=np.sum(np.argmax(evalModels[bucket](x)[:len(y)],axis=1)!=y)
+		num+=len(y)
+	return 1-float(errors)/num
+
+def AdadeltaAccumulators(params):
+	'''
+	>>>create the running averages of squared gradients and squared updates used by AdadeltaUpdate
+
+	>>>type params: tuple or list
+	>>>para params: parameters
+	'''
+	exp_sqr_grads=OrderedDict({})
+	exp_sqr_update=OrderedDict({})
+	for param in params:
+		empty=np.zeros_like(param.get_value())
+		exp_sqr_grads[param]=theano.shared(value=as_floatX(empty),name='exp_grad_%s'%param.name)
+		exp_sqr_update[param]=theano.shared(value=as_floatX(empty),name='exp_grad_%s'%param.name)
+	return exp_sqr_grads,exp_sqr_update
+
+def AdadeltaUpdate(params,cost,rho=0.95,epsilon=1e-6,norm_lim=9,accumulators=None):
 	'''
 	>>>
 
@@ -35,15 +82,15 @@ def AdadeltaUpdate(params,cost,rho=0.95,epsilon=1e-6,norm_lim=9):
 	>>>para epsilon:
 	>>>type norm_lim: int
 	>>>para norm_lim:
+	>>>type accumulators: tuple of 2 dicts
+	>>>para accumulators: shared state from AdadeltaAccumulators, newly created if None
 	'''
 	updates=OrderedDict({})
-	exp_sqr_grads=OrderedDict({})
-	exp_sqr_update=OrderedDict({})
+	if accumulators==None:
+		accumulators=AdadeltaAccumulators(params)
+	exp_sqr_grads,exp_sqr_update=accumulators
 	g_params=[]
 	for param in params:
-		empty=np.zeros_like(param.get_value())
-		exp_sqr_grads[param]=theano.shared(value=as_floatX(empty),name='exp_grad_%s'%param.name)
-		exp_sqr_update[param]=theano.shared(value=as_floatX(empty),name='exp_grad_%s'%param.name)
 		gp=T.grad(cost,param)
 		g_params.append(gp)
 	for param,gp in zip(params,g_params):
@@ -67,6 +114,32 @@ def AdadeltaUpdate(params,cost,rho=0.95,epsilon=1e-6,norm_lim=9):
 			updates[param]=stepped_param
 	return updates
 
+def loadRCNNModel(fileName):
+	'''
+	>>>rebuild a model from a checkpoint written by RCNNModel.saveCheckpoint, no training function is compiled
+
+	>>>type fileName: str
+	>>>para fileName: checkpoint file
+	'''
+	data=np.load(fileName)
+	network=RCNNModel(
+		wordMatrix=data['wordVec'],
+		shape=tuple(data['config_shape'].tolist()),
+		filters=tuple(data['config_filters'].tolist()),
+		rfilter=tuple(data['config_rfilter'].tolist()),
+		features=tuple(data['config_features'].tolist()),
+		time=int(data['config_time']),
+		categories=int(data['config_categories']),
+		static=bool(data['config_static']),
+		dropoutRate=tuple(data['config_dropoutRate'].tolist()),
+		learningRate=float(data['config_learningRate']),
+		name=str(data['name'])
+	)
+	network.restore(fileName)
+	if 'words' in data.files:
+		network.wordIndex=wordIndexOf(data['words'])
+	return network
+
 class RCNNModel(object):
 	
 	def __init__(self,wordMatrix,shape,filters,rfilter,features,time,
@@ -100,6 +173,10 @@ class RCNNModel(object):
 		self.learningRate=learningRate
 		self.static=static
 		self.name=name
+		self.config={
+			'shape':shape,'filters':filters,'rfilter':rfilter,'features':features,'time':time,
+			'categories':categories,'static':static,'dropoutRate':dropoutRate,'learningRate':learningRate
+		}
 
 		rng=np.random.RandomState(2011010539)
 		self.batchSize,featureMaps,self.sentenceLen,self.dimension=shape
@@ -155,7 +232,8 @@ class RCNNModel(object):
 			self.params+=[self.wordVec]
 
 
-		self.cost=self.layer1.negative_log_likelyhood(self.y)+1e-4*T.sqrt(weights) #Weight Decay
+		self.weightDecay=1e-4*T.sqrt(weights)
+		self.cost=self.layer1.negative_log_likelyhood(self.y)+self.weightDecay #Weight Decay
 		self.errors=self.layer1.errors(self.y)
 
 		#for key in self.params:
@@ -165,71 +243,302 @@ class RCNNModel(object):
 			(paramI,paramI-gradI*0.03)
 			for (paramI,gradI) in zip(self.params,grads)
 		]
-		self.adadeltaUpdate=AdadeltaUpdate(self.params,self.cost)
+		self.accumulators=AdadeltaAccumulators(self.params)
+		self.adadeltaUpdate=AdadeltaUpdate(self.params,self.cost,accumulators=self.accumulators)
+
+		self.initParams=[param.get_value() for param in self.params]
+		self.functions={}
+		self.stateSlot=0			#which of the two parameter files of saveState was written last
+		self.evalFunctions={}
+		self.wordIndex=None			#map word to its row of wordVec, saved with checkpoints if set
 
 		print 'the model '+self.name+' constructed!'
 
-	def train_validate_test(self,trainSet,validateSet,testSet,nEpoch):
+	def reset(self):
 		'''
-		>>>train and test the model
+		>>>restore the initial parameters, clear the Adadelta state and reseed the dropout streams, the compiled functions are kept for the next run
+		>>>the streams get the seeds of a new model whose graphs are built in the same order
+		'''
+		for param,value in zip(self.params,self.initParams):
+			param.set_value(value)
+		for layer in self.layers0:
+			layer.srng.seed(layer.seed)
+		for accumulator in self.accumulators:
+			for param in accumulator:
+				accumulator[param].set_value(np.zeros_like(accumulator[param].get_value(borrow=True)))
 
-		>>>type trainSet/validateSet/testSet: matrix
-		>>>para trainSet/validateSet/testSet: different subset
+	def bucketGraph(self,sentenceLen):
+		'''
+		>>>build the cost, predictions and updates of sentences padded to sentenceLen, sharing all parameters of the model
 
-		>>>type nEpoch: int
-		>>>para nEpoch: maximum iteration epoches
+		>>>type sentenceLen: int
+		>>>para sentenceLen: padded length of the sentences in a bucket
+		'''
+		if sentenceLen==self.sentenceLen:
+			return self.cost,self.layer1.predict,self.adadeltaUpdate
+		shape=(self.batchSize,1,sentenceLen,self.dimension)
+		input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape(shape)
+		layer1Inputs=[]
+		for layer in self.layers0:
+			output=layer.forward(input,shape,True,[sentenceLen-layer.filters[2]+1,1])
+			layer1Inputs.append(output.flatten(2))
+		output=self.layer1.forward(T.concatenate(layer1Inputs,1))
+		cost=self.layer1.negative_log_likelyhood(self.y,output)+self.weightDecay
+		predict=T.argmax(output,axis=1)
+		updates=AdadeltaUpdate(self.params,cost,accumulators=self.accumulators)
+		return cost,predict,updates
+
+	def buildBucket(self,sentenceLen):
 		'''
-		print trainSet['x'].shape
-		trainSize=trainSet['x'].shape[0]
-		validateSize=validateSet['x'].shape[0]
-		testSize=testSet['x'].shape[0]
-		trainX=theano.shared(trainSet['x'],borrow=True)
-		trainY=theano.shared(trainSet['y'],borrow=True)
-		trainY=T.cast(trainY,'int32')
-		validateX=theano.shared(validateSet['x'],borrow=True)
-		validateY=theano.shared(validateSet['y'],borrow=True)
-		validateY=T.cast(validateY,'int32')
-		testX=testSet['x']
-		testY=np.asarray(testSet['y'],'int32')
-		trainBatches=trainSize/self.batchSize
-		validateBatches=validateSize/self.batchSize
+		>>>compile the train function of sentences padded to sentenceLen, training minibatches are sliced from shared data
+		>>>the train function returns the cost, the num of errors and the predicted labels of a minibatch from one pass
+
+		>>>type sentenceLen: int
+		>>>para sentenceLen: padded length of the sentences in a bucket
+		'''
+		cost,predict,updates=self.bucketGraph(sentenceLen)
+		errors=T.mean(T.neq(predict,self.y))
+		errorCount=T.sum(T.neq(predict,self.y))
+		data={}
+		data['trainX']=theano.shared(np.zeros((0,sentenceLen),dtype=theano.config.floatX),borrow=True)
+		data['trainY']=theano.shared(np.zeros(0,dtype=theano.config.floatX),borrow=True)
+		trainX=data['trainX']
+		trainY=T.cast(data['trainY'],'int32')
 
 		index=T.iscalar('index')
-		testMatrix=T.matrix('WordMatrix')
-		testLabel=T.iscalar('TestLabel')
-		learnRate=T.scalar('lr')
 
 		trainModel=theano.function(
-		[index],self.cost,updates=self.adadeltaUpdate,
+		[index],[cost,errorCount,predict],updates=updates,
 		givens={
 		self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
 		self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]})
 		print 'training model constructed!'
 
+		return {'data':data,'train':trainModel,'errors':errors,'testTrain':None}
+
+	def compileEval(self,sentenceLen):
+		'''
+		>>>get the function mapping a minibatch of sentences padded to sentenceLen to class probabilities without dropout, compiled once per shape
+		>>>it serves validation, testing and prediction, and needs none of the training functions
+
+		>>>type sentenceLen: int
+		>>>para sentenceLen: padded length of the sentences
+		'''
+		if sentenceLen not in self.evalFunctions:
+			evalLayer0Output=[]
+			shape=(self.batchSize,1,sentenceLen,self.dimension)
+			evalLayer0Input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape(shape)
+			for layer in self.layers0:
+				output=layer.forward(evalLayer0Input,shape,False,[sentenceLen-layer.filters[2]+1,1])
+				evalLayer0Output.append(output.flatten(2))
+			evalOutput=self.layer1.forward(T.concatenate(evalLayer0Output,1))
+			self.evalFunctions[sentenceLen]=theano.function([self.x],evalOutput)
+			print 'evaluation model constructed!'
+		return self.evalFunctions[sentenceLen]
+
+	def probabilities(self,matrix):
+		'''
+		>>>class probabilities of sentences, evaluated in minibatches with the last partial one padded with zeros
+
+		>>>type matrix: np.array
+		>>>para matrix: word entries of the sentences, e.g. from loadDataset.encodeCorpus
+		'''
+		evalModel=self.compileEval(matrix.shape[1])
+		outputs=[]
+		for start in xrange(0,len(matrix),self.batchSize):
+			x=np.asarray(matrix[start:start+self.batchSize],dtype=theano.config.floatX)
+			num=len(x)
+			if num<self.batchSize:
+				x=np.concatenate([x,np.zeros((self.batchSize-num,x.shape[1]),dtype=x.dtype)])
+			outputs.append(evalModel(x)[:num])
+		if len(outputs)==0:
+			return np.zeros((0,self.layer1.b.get_value().shape[0]),dtype=theano.config.floatX)
+		return np.concatenate(outputs)
+
+	def buildTestTrain(self,sentenceLen):
+		'''
+		>>>compile the function evaluating the training set without updates, only needed when the train precision is not taken from the train function
+
+		>>>type sentenceLen: int
+		>>>para sentenceLen: padded length of the sentences in a bucket
+		'''
+		functions=self.functions[sentenceLen]
+		trainX=functions['data']['trainX']
+		trainY=T.cast(functions['data']['trainY'],'int32')
+		index=T.iscalar('index')
 		testTrain=theano.function(
-		[index],self.errors,
+		[index],functions['errors'],
 		givens={
 		self.x:trainX[index*self.batchSize:(index+1)*self.batchSize],
 		self.y:trainY[index*self.batchSize:(index+1)*self.batchSize]})
 		print 'test training set model constructed!'
+		return testTrain
 
-		validateModel=theano.function(
-		[index],self.errors,
-		givens={
-		self.x:validateX[index*self.batchSize:(index+1)*self.batchSize],
-		self.y:validateY[index*self.batchSize:(index+1)*self.batchSize]})
-		print 'validation model constructed!'
+	def compileBucket(self,trainSet,evalTrain=True):
+		'''
+		>>>get the train/eval functions of one length bucket, compiled once per shape, and load the training set of the bucket into their shared data
 
-		testLayer0Output=[]
-		testLayer0Input=self.wordVec[T.cast(self.x.flatten(),dtype='int32')].reshape((testSize,1,self.sentenceLen,self.dimension))
-		for layer in self.layers0:
-			output=layer.process(testLayer0Input,testSize)
-			testLayer0Output.append(output.flatten(2))
-		testLayer1Input=T.concatenate(testLayer0Output,1)
-		testPredict=self.layer1.predictInstance(testLayer1Input)
-		testError=T.mean(T.neq(testPredict,self.y))
-		testModel=theano.function([self.x,self.y],testError)
-		print 'testing model constructed!'
+		>>>type trainSet: dict
+		>>>para trainSet: training sentences of the bucket, padded to the same length
+		>>>type evalTrain: boolean
+		>>>para evalTrain: also get the function evaluating the training set, None is returned for it if False
+		'''
+		sentenceLen=trainSet['x'].shape[1]
+		if sentenceLen not in self.functions:
+			self.functions[sentenceLen]=self.buildBucket(sentenceLen)
+		functions=self.functions[sentenceLen]
+		if evalTrain and functions['testTrain']==None:
+			functions['testTrain']=self.buildTestTrain(sentenceLen)
+		data=functions['data']
+		trainModel=functions['train']
+		testTrain=functions['testTrain'] if evalTrain else None
+		evalModel=self.compileEval(sentenceLen)
+		data['trainX'].set_value(trainSet['x'],borrow=True)
+		data['trainY'].set_value(trainSet['y'],borrow=True)
+		return trainModel,testTrain,evalModel
+
+	def saveCheckpoint(self,fileName):
+		'''
+		>>>save the architecture, all parameters and the Adadelta state to a *.npz file, replacing it at once
+		>>>wordVec is saved for static models as well, it is drawn at random for words without a pretrained vector and differs between runs
+
+		>>>type fileName: str
+		>>>para fileName: checkpoint file
+		'''
+		arrays={'name':self.name,'wordVec':self.wordVec.get_value(borrow=True)}
+		if self.wordIndex!=None:
+			arrays['words']=wordArray(self.wordIndex,len(arrays['wordVec']))
+		for key,value in self.config.items():
+			arrays['config_'+key]=np.array(value)
+		exp_sqr_grads,exp_sqr_update=self.accumulators
+		for i,param in enumerate(self.params):
+			if param is not self.wordVec:				#saved once, as wordVec
+				arrays['param_%d'%i]=param.get_value(borrow=True)
+			arrays['exp_sqr_grads_%d'%i]=exp_sqr_grads[param].get_value(borrow=True)
+			arrays['exp_sqr_update_%d'%i]=exp_sqr_update[param].get_value(borrow=True)
+		with open(fileName+'.tmp','wb') as fwrite:
+			np.savez(fwrite,**arrays)
+		os.rename(fileName+'.tmp',fileName)
+
+	def restore(self,fileName):
+		'''
+		>>>load the parameters and the Adadelta state saved by saveCheckpoint into this model
+
+		>>>type fileName: str
+		>>>para fileName: checkpoint file
+		'''
+		data=np.load(fileName)
+		if 'wordVec' in data.files:				#left out of the states of static models by older versions
+			self.wordVec.set_value(data['wordVec'])
+		exp_sqr_grads,exp_sqr_update=self.accumulators
+		for i,param in enumerate(self.params):
+			if param is not self.wordVec:
+				param.set_value(data['param_%d'%i])
+			exp_sqr_grads[param].set_value(data['exp_sqr_grads_%d'%i])
+			exp_sqr_update[param].set_value(data['exp_sqr_update_%d'%i])
+		print 'the model '+self.name+' restored from '+fileName
+
+	def saveState(self,fileName,progress,checkpoint=None):
+		'''
+		>>>save everything needed to resume training: parameters and Adadelta state by saveCheckpoint, random states and the progress of train_validate_test in a small pickle
+		>>>the parameters go to fileName.0.npz and fileName.1.npz in turn and the pickle, replaced last, names the one written with it, so a crash while saving leaves the last state whole
+
+		>>>type fileName: str
+		>>>para fileName: state file
+		>>>type progress: dict
+		>>>para progress: epoch, minibatch cursor, accuracy curves etc. of train_validate_test
+		>>>type checkpoint: str
+		>>>para checkpoint: checkpoint saved with the current parameters, linked as the parameter file instead of writing them again, None if there is none
+		'''
+		self.stateSlot=1-self.stateSlot
+		parameters='%s.%d.npz'%(fileName,self.stateSlot)
+		linked=False
+		if checkpoint!=None and hasattr(os,'link'):
+			if os.path.exists(parameters):
+				os.remove(parameters)
+			try:
+				os.link(checkpoint,parameters)
+				linked=True
+			except OSError:				#e.g. on another file system
+				pass
+		if not linked:
+			self.saveCheckpoint(parameters)
+		state={
+			'progress':progress,
+			'slot':self.stateSlot,
+			'streams':[stream.get_value(borrow=True) for stream in self.randomStreams()],
+			'random':np.random.get_state()
+		}
+		with open(fileName+'.tmp','wb') as fwrite:
+			cPickle.dump(state,fwrite,protocol=cPickle.HIGHEST_PROTOCOL)
+		os.rename(fileName+'.tmp',fileName)
+
+	def restoreState(self,fileName):
+		'''
+		>>>load a state saved by saveState into this model and return the progress of train_validate_test
+
+		>>>type fileName: str
+		>>>para fileName: state file
+		'''
+		with open(fileName,'rb') as fopen:
+			state=cPickle.load(fopen)
+		self.stateSlot=state['slot']			#the next save keeps this file
+		self.restore('%s.%d.npz'%(fileName,self.stateSlot))
+		for stream,value in zip(self.randomStreams(),state['streams']):
+			stream.set_value(value)
+		np.random.set_state(state['random'])
+		print 'training resumed from '+fileName
+		return state['progress']
+
+	def randomStreams(self):
+		'''
+		>>>the shared random states drawing the dropout masks of all compiled graphs, in the order the graphs were built
+		'''
+		return [stream for layer in self.layers0 for stream,update in layer.srng.state_updates]
+
+	def train_validate_test(self,trainSet,validateSet,testSet,nEpoch,monitor=None,checkpoint=None,state=None,resume=False):
+		'''
+		>>>train and test the model
+
+		>>>type trainSet/validateSet/testSet: dict or list of dict
+		>>>para trainSet/validateSet/testSet: different subset, or a list of its length buckets
+
+		>>>type nEpoch: int
+		>>>para nEpoch: maximum iteration epoches
+		>>>type monitor: dict
+		>>>para monitor: evaluation settings overriding defaultMonitor
+		>>>type checkpoint: str
+		>>>para checkpoint: file to save the model to at every new best validation precision, not saved if None
+		>>>type state: str
+		>>>para state: file to save the training state to at every evaluation, not saved if None
+		>>>type resume: boolean
+		>>>para resume: continue from the state file if it exists
+		'''
+		settings=dict(defaultMonitor)
+		if monitor!=None:
+			settings.update(monitor)
+
+		if isinstance(trainSet,dict):
+			trainSet=[trainSet];validateSet=[validateSet];testSet=[testSet]
+
+		trainModels=[];testTrains=[];evalModels=[]
+		trainBatches=[];validateBatches=[];testBatches=[];fullBatches=[]
+		for bucket in xrange(len(trainSet)):
+			print trainSet[bucket]['x'].shape
+			trainModel,testTrain,evalModel=self.compileBucket(trainSet[bucket],not settings['running'])
+			trainModels.append(trainModel)
+			testTrains.append(testTrain)
+			evalModels.append(evalModel)
+			trainBatches+=[(bucket,i) for i in xrange(trainSet[bucket]['x'].shape[0]/self.batchSize)]
+			validateSize=validateSet[bucket]['x'].shape[0]
+			validateBatches+=[(bucket,i) for i in xrange((validateSize+self.batchSize-1)/self.batchSize)]
+			fullBatches+=[(bucket,i) for i in xrange(validateSize/self.batchSize)]
+			testBatches+=[(bucket,i) for i in xrange((testSet[bucket]['x'].shape[0]+self.batchSize-1)/self.batchSize)]
+		evalBatches=max(1,settings['examples']/self.batchSize)
+		sampleBatches=validateBatches
+		if 0<settings['validateBatches']<len(fullBatches):
+			sample=np.random.permutation(len(fullBatches))[:settings['validateBatches']]
+			sampleBatches=[fullBatches[i] for i in sample]
 
 		epoch=0
 		iteration=0
@@ -244,62 +553,106 @@ class RCNNModel(object):
 		self.costValue=[]
 		self.result={}
 
+		def progress():
+			return {
+				'epoch':epoch,'num':num,'order':order,'runningError':runningError,'epochError':epochError,
+				'sampleBatches':sampleBatches,'minError':minError,'bestValPrecision':bestValPrecision,'finalPrecision':finalPrecision,
+				'trainAcc':self.trainAcc,'validateAcc':self.validateAcc,'testAcc':self.testAcc,'costValue':self.costValue
+			}
+
+		order=None
+		if resume and state!=None and os.path.exists(state):
+			resumed=self.restoreState(state)
+			epoch=resumed['epoch'];num=resumed['num'];order=resumed['order']
+			runningError=resumed['runningError'];epochError=resumed['epochError']
+			sampleBatches=resumed['sampleBatches']
+			minError=resumed['minError'];bestValPrecision=resumed['bestValPrecision'];finalPrecision=resumed['finalPrecision']
+			self.trainAcc=resumed['trainAcc'];self.validateAcc=resumed['validateAcc']
+			self.testAcc=resumed['testAcc'];self.costValue=resumed['costValue']
+			if num>=len(order):				#the epoch was finished
+				order=None
+
 		while epoch<nEpoch and iteration<maxIteration:
-			epoch+=1
-			num=0
-			for minBatch in np.random.permutation(range(trainBatches)):
-				cost=trainModel(minBatch)				#set zero func
-				x=float(epoch)+float(num+1)/float(trainBatches)-1
+			if order is None:
+				epoch+=1
+				num=0
+				runningError=[]
+				epochError=[]
+				order=np.random.permutation(len(trainBatches))
+			lastEval=time.time()
+			for minBatch in order[num:]:
+				bucket,i=trainBatches[minBatch]
+				cost,errorCount,predict=trainModels[bucket](i)				#set zero func
+				runningError.append(errorCount)
+				epochError.append(errorCount)
+				x=float(epoch)+float(num+1)/float(len(trainBatches))-1
 				self.costValue.append({'x':x,'value':cost})
-				if num%50==0:
-					trainError=[
-						testTrain(i)
-						for i in xrange(trainBatches)
-					]
-					trainPrecision=1-np.mean(trainError)
-					validateError=[
-						validateModel(i)
-						for i in xrange(validateBatches)
-					]
-					validatePrecision=1-np.mean(validateError)
+				if settings['seconds']>0:
+					due=time.time()-lastEval>=settings['seconds']
+				else:
+					due=num%evalBatches==0
+				if due:
+					saved=None
+					if settings['running']:
+						trainPrecision=1-float(np.sum(runningError))/(len(runningError)*self.batchSize)
+					else:
+						trainError=[
+							testTrains[bucket](i)
+							for bucket,i in trainBatches
+						]
+						trainPrecision=1-np.mean(trainError)
+					validatePrecision=evalPrecision(evalModels,validateSet,sampleBatches,self.batchSize)
 					print 'epoch=%i,num=%i,train precision=%f%%, validation precision=%f%%'%(epoch,num,trainPrecision*100.,validatePrecision*100.)
 					self.trainAcc.append({'x':x,'acc':trainPrecision})
 					self.validateAcc.append({'x':x,'acc':validatePrecision})
 					if validatePrecision>bestValPrecision:
-						testError=testModel(testX,testY)
+						testError=1-evalPrecision(evalModels,testSet,testBatches,self.batchSize)
 						testPrecision=1-testError
 						minError=min(minError,testError)					
 						finalPrecision=testPrecision
 						bestValPrecision=validatePrecision
 						print 'testing precision=%f%%'%(testPrecision*100.)
 						self.testAcc.append({'x':x,'acc':testPrecision})
+						if checkpoint!=None:
+							self.saveCheckpoint(checkpoint)
+							saved=checkpoint
 					print 'bestValPrecision=%f%%'%(bestValPrecision*100.)
+					runningError=[]
+					lastEval=time.time()
 				num+=1
+				if due and state!=None:
+					self.saveState(state,progress(),saved)
 
 			x=float(epoch)
-			trainError=[
-				testTrain(i)
-				for i in xrange(trainBatches)
-			]
-			trainPrecision=1-np.mean(trainError)
-			validateError=[
-				validateModel(i)
-				for i in xrange(validateBatches)
-			]
-			validatePrecision=1-np.mean(validateError)
+			if settings['running']:
+				trainPrecision=1-float(np.sum(epochError))/(len(epochError)*self.batchSize)
+			else:
+				trainError=[
+					testTrains[bucket](i)
+					for bucket,i in trainBatches
+				]
+				trainPrecision=1-np.mean(trainError)
+			validatePrecision=evalPrecision(evalModels,validateSet,validateBatches,self.batchSize)
 			print 'epoch=%i,train precision=%f%%, validation precision=%f%%'%(epoch,trainPrecision*100.,validatePrecision*100.)
 			self.trainAcc.append({'x':x,'acc':trainPrecision})
 			self.validateAcc.append({'x':x,'acc':validatePrecision})
+			saved=None
 			if validatePrecision>bestValPrecision:
-				testError=testModel(testX,testY)
+				testError=1-evalPrecision(evalModels,testSet,testBatches,self.batchSize)
 				testPrecision=1-testError
 				minError=min(minError,testError)
 				finalPrecision=testPrecision
 				bestValPrecision=validatePrecision
 				print 'testing precision=%f%%'%(testPrecision*100.)
 				self.testAcc.append({'x':x,'acc':testPrecision})
+				if checkpoint!=None:
+					self.saveCheckpoint(checkpoint)
+					saved=checkpoint
 			print 'bestValPrecision=%f%%'%(bestValPrecision*100.)
 			print 'bestTestPrecision=%f%%, finalPrecision=%f%%'%((1-minError)*100.,finalPrecision*100.)
+			if state!=None:
+				self.saveState(state,progress(),saved)
+			order=None
 
 		self.result={'minError':minError,'finalAcc':finalPrecision,'bestValAcc':bestValPrecision}
 
@@ -310,3 +663,47 @@ class RCNNModel(object):
 		timeStruct=time.localtime(time.time())
 		fileName=str(timeStruct.tm_mon)+'_'+str(timeStruct.tm_mday)+'_'+str(timeStruct.tm_hour)+'_'+str(timeStruct.tm_min)+'__'+str(self.result['finalAcc'])+'_'+self.name
 		cPickle.dump([self.result,self.trainAcc,self.validateAcc,self.testAcc,self.costValue],open(savePath+fileName,'wb'))
+
+	def export(self,fileName):
+		'''
+		>>>dump the parameters, the architecture and the words of the rows to a *.npz file, loaded by numpyModel.NumpyRCNNModel for inference without theano
+
+		>>>type fileName: str
+		>>>para fileName: *.npz file
+		'''
+		first=self.layers0[0]
+		arrays={
+			'filters':np.array([layer.filters[2] for layer in self.layers0]),
+			'rfilter':np.array(first.rfilter[2:]),
+			'time':first.time,'alpha':first.alpha,'beta':first.beta,'N':first.N,
+			'dropout':np.array([layer.dropoutRate for layer in self.layers0]),
+			'sentenceLen':self.sentenceLen,
+			'batchSize':self.batchSize,
+			'w':self.layer1.w.get_value(),
+			'b':self.layer1.b.get_value(),
+			'wordVec':self.wordVec.get_value()
+		}
+		if self.wordIndex!=None:
+			arrays['words']=wordArray(self.wordIndex,len(arrays['wordVec']))
+		for i,layer in enumerate(self.layers0):
+			arrays['w_in_%d'%i]=layer.w_in.get_value()
+			arrays['w_r_%d'%i]=layer.w_r.get_value()
+			arrays['b_%d'%i]=layer.b.get_value()
+			arrays['b_r_%d'%i]=layer.b_r.get_value()
+		np.savez(fileName,**arrays)
+
+	def checkExport(self,fileName,matrix,tolerance=1e-4):
+		'''
+		>>>load a model exported by export with numpyModel.NumpyRCNNModel and make sure it gives the class probabilities of this model, raise ValueError otherwise
+
+		>>>type fileName: str
+		>>>para fileName: *.npz file written by export
+		>>>type matrix: np.array
+		>>>para matrix: word entries of the sentences to compare on, e.g. the test set
+		>>>type tolerance: float
+		>>>para tolerance: largest difference of a probability allowed
+		'''
+		difference=np.abs(NumpyRCNNModel(fileName).probabilities(matrix)-self.probabilities(matrix)).max() if len(matrix)>0 else 0.0
+		print 'exported model %s checked on %d sentences, max difference %g'%(fileName,len(matrix),difference)
+		if difference>tolerance:
+			raise ValueError('the exported model %s differs from %s by %g'%(fileName,self.name,difference))
@@ -10,9 +10,43 @@ from normLayer import *
 def ReLU(x):
 	return theano.tensor.switch(x<0,0,x)
 
+def sameConv(input,filters,filter_shape,image_shape):
+	'''
+	>>>convolution whose output has the same height and width as input, only the kept outputs of a full convolution are computed
+	>>>with a filter width of 1, e.g. rfilter=(5,1), it runs as a 1-D convolution along the sentence axis: one matrix product per filter row
+
+	>>>type input: T.tensor4
+	>>>para input: input data
+	>>>type filters: T.tensor4
+	>>>para filters: convolution kernels
+	>>>type filter_shape: tuple or list of length 4
+	>>>para filter_shape: (num of output feature maps, num of input feature maps, filter height, filter width)
+	>>>type image_shape: tuple or list of length 4
+	>>>para image_shape: (batch_size,num of input feature maps, image height, image width)
+	'''
+	#output[j] is full[j+height/2], i.e. the valid convolution of the input with (height-1)/2 zero rows above and height/2 below
+	batchSize,channels,height,width=image_shape
+	filterHeight,filterWidth=filter_shape[2:]
+	top=(filterHeight-1)/2;left=(filterWidth-1)/2
+	#a width of 1 would make the zeros broadcastable, the output keeps the type of the input for theano.scan
+	padded=T.unbroadcast(T.zeros((batchSize,channels,height+filterHeight-1,width+filterWidth-1),dtype=input.dtype),0,1,2,3)
+	padded=T.set_subtensor(padded[:,:,top:top+height,left:left+width],input)
+	if filterWidth==1:
+		#row j of the flipped kernel meets the rows j..j+height-1 of the padded input
+		output=0
+		for j in xrange(filterHeight):
+			output+=T.tensordot(padded[:,:,j:j+height,:],filters[:,:,filterHeight-1-j,0],axes=[[1],[1]])
+		return output.dimshuffle(0,3,1,2)
+	return conv.conv2d(
+		input=padded,
+		filters=filters,
+		filter_shape=filter_shape,
+		image_shape=(batchSize,channels,height+filterHeight-1,width+filterWidth-1)
+	)
+
 class RecurrentConvLayer(object):
 	
-	def __init__(self,rng,input,shape,filters,rfilter,alpha,beta,N,time,pool):
+	def __init__(self,rng,input,shape,filters,rfilter,alpha,beta,N,time,pool,dropout=0.0):
 		'''
 		>>>type rng: numpy.random.RandomState
 		>>>para rng: random seed
@@ -37,11 +71,15 @@ class RecurrentConvLayer(object):
 
 		>>>type pool: tuple or list of length 2
 		>>>para pool: pooling size
+
+		>>>type dropout: float
+		>>>para dropout: dropout rate of the output, no dropout if 0
 		'''
 
 		assert shape[1]==filters[1]
 		assert filters[0]==rfilter[0]
 		assert rfilter[0]==rfilter[1]
+		self.dropoutRate=dropout
 		self.input=input
 		self.filters=filters;self.rfilter=rfilter
 		self.shape=shape;self.time=time;self.pool=pool
@@ -64,6 +102,33 @@ class RecurrentConvLayer(object):
 		b_r_init=np.zeros(shape=rfilter[0],dtype=theano.config.floatX)
 		self.b_r=theano.shared(value=b_r_init,name='b_r')
 
+		print 'initialize the weight'
+
+		self.seed=rng.randint(2011010539)		#the dropout streams are reseeded with it when the model is reset
+		self.srng=T.shared_randomstreams.RandomStreams(self.seed)
+		self.output=self.forward(input,shape)
+		self.param=[self.w_in,self.w_r,self.b,self.b_r]
+
+		print 'recurrentconvlayer constructed!'
+
+	def forward(self,input,shape,train=True,pool=None):
+		'''
+		>>>build the recurrent convolution of input, sharing the weights of this layer, for both training and inference
+
+		>>>type input: T.tensor4
+		>>>para input: input data
+		>>>type shape: tuple or list of length 4
+		>>>para shape: (batch_size,num of input feature maps, image height, image width)
+		>>>type train: boolean
+		>>>para train: drop units randomly if True, scale them by the keep rate otherwise
+		>>>type pool: tuple or list of length 2
+		>>>para pool: pooling size, the same as the layer if None
+		'''
+		if pool==None:
+			pool=self.pool
+		filters=self.filters;rfilter=self.rfilter
+		layer_size=(shape[0],filters[0],shape[2]-filters[2]+1,shape[3]-filters[3]+1)
+
 		conv_input=conv.conv2d(
 			input=input,
 			filters=self.w_in,
@@ -71,121 +136,72 @@ class RecurrentConvLayer(object):
 			image_shape=shape
 			)
 
-		print 'initialize the weight'
-
-		state=conv_input+self.b_r.dimshuffle('x',0,'x','x')
-		axis2Padleft=rfilter[2]/2;axis2Padright=(rfilter[2]-1)/2
-		axis3Padleft=rfilter[3]/2;axis3Padright=(rfilter[3]-1)/2
-		axis2Padright=layer_size[2]+rfilter[2]-1 if axis2Padright==0 else -axis2Padright
-		axis3Padright=layer_size[3]+rfilter[3]-1 if axis3Padright==0 else -axis3Padright
-		for i in xrange(time):
-			conv_recurrent=conv.conv2d(
-				input=state,
-				filters=self.w_r,
-				filter_shape=rfilter,
-				image_shape=layer_size,
-				border_mode='full'
-			)
-			state=ReLU(conv_input+conv_recurrent[:,:,axis2Padleft:axis2Padright,axis3Padleft:axis3Padright])
-#			padded_input=TensorPadding(TensorPadding(input=state,width=rfilter[2]-1,axis=2),width=rfilter[3]-1,axis=3)
-#			conv_recurrent=conv.conv2d(
-#				input=padded_input,
-#				filters=self.w_r,
-#				filter_shape=rfilter,
-#				image_shape=[layer_size[0],layer_size[1],layer_size[2]+rfilter[2]-1,layer_size[3]+rfilter[3]-1]
-#			)
-#			state=ReLU(conv_input+conv_recurrent)
-			norm=NormLayer(
-				input=state,
-				shape=layer_size,
-				alpha=alpha,
-				beta=beta,
-				N=N
-			)
-			state=norm.output
+		state=self.recurrence(conv_input,layer_size)
 
 		pool_out=downsample.max_pool_2d(
 			input=state,
 			ds=pool,
 			ignore_border=True
 		)
-		self.output=pool_out+self.b.dimshuffle('x',0,'x','x')
-		self.param=[self.w_in,self.w_r,self.b,self.b_r]
-
-		print 'recurrentconvlayer constructed!'
+		output=pool_out+self.b.dimshuffle('x',0,'x','x')
+		if self.dropoutRate>0:
+			if train:
+				output=dropoutFunc(self.srng,output,self.dropoutRate)
+			else:
+				output=output*(1.0-self.dropoutRate)
+		return output
 
-	def process(self,data,batchSize):
+	def recurrence(self,conv_input,layer_size):
 		'''
-		>>>process new data
+		>>>iterate the recurrent connection self.time times as one theano.scan, the graph of a step is built once whatever self.time is
 
-		>>>type data: T.tensor4
-		>>>para data: newly processed data
-		>>>type batchSize: int
-		>>>para batchSize: batch size
+		>>>type conv_input: T.tensor4
+		>>>para conv_input: feed-forward convolution of the input, added at every step
+		>>>type layer_size: tuple or list of length 4
+		>>>para layer_size: (batch_size,num of feature maps, height, width) of the states
 		'''
-		shape=(batchSize,1,self.shape[2],self.shape[3])
-		layer_size=(batchSize,self.filters[0],shape[2]-self.filters[2]+1,shape[3]-self.filters[3]+1)
-
-		conv_input=conv.conv2d(
-			input=data,
-			filters=self.w_in,
-			filter_shape=self.filters,
-			image_shape=shape
-		)
-
-		state=conv_input+self.b_r.dimshuffle('x',0,'x','x')
-		axis2Padleft=self.rfilter[2]/2;axis2Padright=(self.rfilter[2]-1)/2
-		axis3Padleft=self.rfilter[3]/2;axis3Padright=(self.rfilter[3]-1)/2
-                axis2Padright=layer_size[2]+self.rfilter[2]-1 if axis2Padright==0 else -axis2Padright
-                axis3Padright=layer_size[3]+self.rfilter[3]-1 if axis3Padright==0 else -axis3Padright
-		for i in xrange(self.time):
-			conv_recurrent=conv.conv2d(
+		def step(state,conv_input,w_r):
+			conv_recurrent=sameConv(
 				input=state,
-				filters=self.w_r,
+				filters=w_r,
 				filter_shape=self.rfilter,
-				image_shape=layer_size,
-				border_mode='full'
+				image_shape=layer_size
 			)
-			state=conv_input+conv_recurrent[:,:,axis2Padleft:axis2Padright,axis3Padleft:axis3Padright]
 			norm=NormLayer(
-				input=state,
+				input=ReLU(conv_input+conv_recurrent),
 				shape=layer_size,
 				alpha=self.alpha,
 				beta=self.beta,
 				N=self.N
 			)
-			state=ReLU(norm.output)
+			return norm.output
 
-		pool_out=downsample.max_pool_2d(
-			input=state,
-			ds=self.pool,
-			ignore_border=True
+		state=conv_input+self.b_r.dimshuffle('x',0,'x','x')
+		if self.time==0:
+			return state
+		states,updates=theano.scan(
+			fn=step,
+			outputs_info=T.unbroadcast(state,0,1,2,3),
+			non_sequences=[conv_input,self.w_r],
+			n_steps=self.time
 		)
-		output=pool_out+self.b.dimshuffle('x',0,'x','x')
-		return output
+		return states[-1]
 
-def dropoutFunc(rng,value,p):
+def dropoutFunc(srng,value,p):
 	'''
 	>>>dropout layer
 
-	>>>type rng: numpy.random.RandomState
-	>>>para rng: random seed
+	>>>type srng: T.shared_randomstreams.RandomStreams
+	>>>para srng: random streams of the layer, their states are kept for resuming training
 	>>>type value: T.tensor4
 	>>>para value: input value
 	>>>type p: float
 	>>>para p: dropout rate
 	'''
-	srng=T.shared_randomstreams.RandomStreams(rng.randint(2011010539))
 	mask=srng.binomial(n=1,p=1-p,size=value.shape)
 	return value*T.cast(mask,theano.config.floatX)
 
 class DropoutRecurrentConvLayer(RecurrentConvLayer):
 
 	def __init__(self,rng,input,shape,filters,rfilter,alpha,beta,N,time,pool,dropout=0.5):
-		RecurrentConvLayer.__init__(self,rng,input,shape,filters,rfilter,alpha,beta,N,time,pool)
-		self.dropoutRate=dropout
-		self.output=dropoutFunc(rng,self.output,dropout)
-
-	def process(self,data,batchSize):
-		output=RecurrentConvLayer.process(self,data,batchSize)
-		return output*self.dropoutRate
+		RecurrentConvLayer.__init__(self,rng,input,shape,filters,rfilter,alpha,beta,N,time,pool,dropout)
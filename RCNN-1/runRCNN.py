@@ -1,71 +1,222 @@
-import sys,warnings
+import cPickle,os,sys,warnings
+import multiprocessing
+
+#BLAS and OpenMP fix their thread counts when numpy and theano are loaded, forked fold workers inherit them,
+#so the cores are shared out among the workers of -w here, before the imports
+if __name__=='__main__' and '-w' in sys.argv[1:-1]:
+	foldWorkers=int(sys.argv[sys.argv.index('-w',1)+1])
+	if foldWorkers>1:
+		for key in ['OMP_NUM_THREADS','OPENBLAS_NUM_THREADS','MKL_NUM_THREADS']:
+			os.environ.setdefault(key,str(max(1,multiprocessing.cpu_count()/foldWorkers)))
+#theano reads its flags when it is imported, the compiled modules kept in -compiledir are reused by every later run and fold worker
+if __name__=='__main__' and '-compiledir' in sys.argv[1:-1]:
+	compiledir=os.path.abspath(sys.argv[sys.argv.index('-compiledir',1)+1])
+	os.environ['THEANO_FLAGS']=','.join([flag for flag in [os.environ.get('THEANO_FLAGS',''),'base_compiledir='+compiledir] if flag!=''])
+
 import numpy as np
 
 from rcnnModel import *
 from loadWordVec import *
+from loadDataset import *
 
 warnings.filterwarnings('ignore')
 sys.setrecursionlimit(40000)
 
-def parseSentence(text,wordIndex,maxLen):
-	'''
-	>>>convert sentence to a matrix
-
-	>>>type text:string
-	>>>para text:raw text
-	>>>type wordIndex:dict
-	>>>para wordIndex:map word to its entry
-	>>>type maxLen:int
-	>>>para maxLen:maximum length of sentences in the whole set
-	'''
-	length=len(text)
-	padLeft=(maxLen-length+1)/2
-	padRight=(maxLen-length)/2
-	vec=[]
-
-	for i in xrange(padLeft):
-		vec.append(0)
-	for word in text:
-		vec.append(wordIndex[word])
-	for i in xrange(padRight):
-		vec.append(0)
-
-	assert len(vec)==maxLen
-	return vec
-
-def loadDatas(dataFile,wordVecFile='',dimension=300,rand=False):
+def loadDatas(dataFile,wordVecFile='',dimension=300,rand=False,cacheDir='',hashBuckets=None,phrases=False,minFreq=1,maxVocab=0,vocabFile='',savedVocab=''):
 	'''
 	>>>load training/validate/test data and wordVec info
 
 	>>>type dataFile/wordVecFile: string
-	>>>para dataFile/wordVecFile: data and wordVec file
+	>>>para dataFile/wordVecFile: data (pickled list or compact *.npz) and wordVec file
 	>>>type dimension: int
 	>>>para dimension: the dimension of word embeddings
 	>>>type static: bool
 	>>>para static: static wordVec or not
+	>>>type cacheDir: str
+	>>>para cacheDir: folder of the filtered wordVec cache, no cache if empty
+	>>>type phrases: bool
+	>>>para phrases: train on the phrases of the *.npz dataset as well, only the data.npz of parseSST.py -phrases has them, the pickled data has none
+	>>>type minFreq/maxVocab: int
+	>>>para minFreq/maxVocab: document frequency cutoff and maximum size of the vocabulary, no cap if maxVocab is 0
+	>>>type vocabFile: str
+	>>>para vocabFile: *.npz file to save the vocabulary in, not saved if empty
+	>>>type savedVocab: str
+	>>>para savedVocab: reuse the vocabulary of this *.npz file written by an earlier run instead of minFreq/maxVocab, so that word ids stay the same
+	>>>type hashBuckets: int
+	>>>para hashBuckets: append the UNK row and this num of hash buckets for words unseen in training, none of them if None
 	'''
-	fopen=open(dataFile,'rb')
-	data=cPickle.load(fopen)
-	fopen.close()
-	sentences,vocab,config=data
-		
-	wordVec=[]
-	if rand==False:
-		vectors,wordIndex=getWordVec(dataFile,wordVecFile)
+	if phrases and not dataFile.endswith('.npz'):
+		raise ValueError('-phrases needs data.npz, run parseSST.py -phrases and pass its data.npz instead of %s'%dataFile)
+	if dataFile.endswith('.npz'):
+		corpus,vocab,config=loadCompactData(dataFile,phrases)
+		sentences=None
+	else:
+		fopen=open(dataFile,'rb')
+		sentences,vocab,config=cPickle.load(fopen)
+		fopen.close()
+
+	if savedVocab!='':
+		vocabulary=loadVocabulary(savedVocab,vocab)
+	else:
+		vocabulary=Vocabulary(vocab,minFreq,maxVocab)
+	if vocabFile!='':
+		vocabulary.save(vocabFile)
+	print 'vocabulary: %d words, %d left out'%(len(vocabulary),vocabulary.dropped)
+
+	if rand==False and cacheDir!='':
+		vectors,wordIndex=getCachedWordVec(vocabulary,wordVecFile,cacheDir)
+	elif rand==False:
+		vectors,wordIndex=vocabWordVec(vocabulary,wordVecFile)
+	else:
+		vectors,wordIndex=vocabRandWordVec(vocabulary,dimension)
+	#words left out of the vocabulary share the UNK row unless hash buckets are asked for
+	if hashBuckets==None and vocabulary.dropped>0:
+		hashBuckets=0
+	if hashBuckets!=None:
+		vectors=addUnknownVec(vectors,hashBuckets)
+
+	if sentences==None:
+		corpus=remapCompactData(corpus,wordIndex,len(vectors))
 	else:
-		vectors,wordIndex=getRandWordVec(dataFile,dimension)
+		corpus=compactSentences(sentences,wordIndex,len(vectors))
+	#no training token reaches the UNK row and the buckets otherwise, rare words train them by word dropout
+	corpus=wordDropout(corpus,wordIndex,len(vectors),vocabulary.freq)
 
-	return sentences,vocab,config,vectors,wordIndex
+	return corpus,vocab,config,vectors,wordIndex
 
-def parseConfig(sentences,vocab,config,vectors,wordIndex,static,name):
+foldJob={}
+
+def repeatRandom(fileName,resume):
+	'''
+	>>>make the random splits of a run the same when it is resumed: restore the numpy random state saved when the run started, or save it
+
+	>>>type fileName: str
+	>>>para fileName: file of the random state
+	>>>type resume: bool
+	>>>para resume: restore the saved state if it exists
+	'''
+	if resume and os.path.exists(fileName):
+		with open(fileName,'rb') as fopen:
+			np.random.set_state(cPickle.load(fopen))
+	else:
+		with open(fileName,'wb') as fwrite:
+			cPickle.dump(np.random.get_state(),fwrite,protocol=cPickle.HIGHEST_PROTOCOL)
+
+def exportModel(network,fileName,checkpoint,testSet):
+	'''
+	>>>export the model for numpyModel.NumpyRCNNModel, the one of the best validation precision if a checkpoint was saved, and check it on the test set
+
+	>>>type network: RCNNModel
+	>>>para network: trained model
+	>>>type fileName: str
+	>>>para fileName: *.npz file to export to
+	>>>type checkpoint: str
+	>>>para checkpoint: checkpoint written by train_validate_test, None if not saved
+	>>>type testSet: dict or list of dict
+	>>>para testSet: test set, or a list of its length buckets
+	'''
+	if checkpoint!=None and os.path.exists(checkpoint):
+		network.restore(checkpoint)
+	network.export(fileName)
+	for bucket in (testSet if isinstance(testSet,list) else [testSet]):
+		network.checkExport(fileName,bucket['x'])
+
+def runFold(item):
+	'''
+	>>>train and test the model on one fold of cross-validation, the data is read from foldJob set up by parseConfig
+
+	>>>type item: int
+	>>>para item: subset ID held out as test set
+	'''
+	corpus=foldJob['corpus']
+	sets=foldJob['sets']
+	batchSize=foldJob['batchSize']
+	bounds=foldJob['bounds']
+	matrix=foldJob['matrix']
+	labels=corpus['label']
+	setLabels=corpus['setLabel']
+	prefix='../Models/%s_%d'%(foldJob['name'],item)
+
+	if foldJob['resume'] and os.path.exists(prefix+'.result'):				#finished before
+		with open(prefix+'.result','rb') as fopen:
+			result=cPickle.load(fopen)
+		print 'fold %d skipped, final precision %f%%'%(item,result['finalAcc']*100.)
+		return result
+	#the split of a fold depends on its index only, not on the worker or the folds run before it
+	np.random.seed(item)
+	repeatRandom(prefix+'.random',foldJob['resume'])
+
+	trainIndex=subsetIndex(setLabels,[subset for subset in sets if subset!=item])
+	testIndex=subsetIndex(setLabels,[item])
+
+	#No ValidationSet
+	trainIndex,validationIndex=splitValidation(trainIndex,labels,foldJob['categories'])
+
+	if foldJob['buckets']>1:
+		trainSet=makeBucketSets(corpus,trainIndex,bounds,batchSize)
+		validateSet=makeBucketSets(corpus,validationIndex,bounds,batchSize)
+		testSet=makeBucketSets(corpus,testIndex,bounds)
+	else:
+		trainIndex=fillBatches(trainIndex,batchSize)
+		validationIndex=fillBatches(validationIndex,batchSize)
+
+		trainSet=makeSet(matrix,labels,trainIndex)
+		validateSet=makeSet(matrix,labels,validationIndex)
+		testSet=makeSet(matrix,labels,testIndex)
+
+	trainSet=dropWords(trainSet,corpus)
+
+	if 'network' in foldJob:				#compiled by an earlier fold of this process
+		network=foldJob['network']
+		network.reset()
+	else:
+		network=RCNNModel(
+			wordMatrix=foldJob['vectors'],
+			shape=(batchSize,1,foldJob['maxLen'],foldJob['dimension']),
+			filters=foldJob['filters'],
+			rfilter=(5,1),
+			features=(80,),
+			time=foldJob['iterations'],categories=foldJob['categories'],
+			static=foldJob['static'],
+			dropoutRate=(0.5,),
+			learningRate=0.01,
+			name=foldJob['name']
+		)
+		network.wordIndex=foldJob['wordIndex']
+		foldJob['network']=network
+
+	checkpoint=None
+	if foldJob['checkpoint']!=None:				#one checkpoint for each fold, e.g. model_3.npz
+		root,ext=os.path.splitext(foldJob['checkpoint'])
+		checkpoint='%s_%d%s'%(root,item,ext)
+	network.train_validate_test(trainSet,validateSet,testSet,10,foldJob['monitor'],checkpoint,prefix+'.state',foldJob['resume'])
+	network.save()
+	exportModel(network,prefix+'.model.npz',checkpoint,testSet)
+	with open(prefix+'.result','wb') as fwrite:
+		cPickle.dump(network.result,fwrite)
+	return network.result
+
+def parseConfig(corpus,vocab,config,vectors,wordIndex,static,name,buckets=1,workers=1,monitor=None,iterations=1,checkpoint=None,resume=False):
 	'''
 	>>>load configs to generate model and train/validate/test batches
 
-	>>>sentences/vocab/config/vectors/wordIndex is the same in README.md file of each dataset
+	>>>vocab/config is the same in README.md file of each dataset, corpus is in the compact format of loadDataset.py
 	>>>type static:bool
 	>>>para static:whether or not to use static wordVec
 	>>>type name:str
 	>>>para name:the name of the model
+	>>>type buckets:int
+	>>>para buckets:num of length buckets, every sentence is padded to the maximum length if 1
+	>>>type workers:int
+	>>>para workers:num of processes training cross-validation folds in parallel
+	>>>type monitor:dict
+	>>>para monitor:evaluation settings of train_validate_test, see defaultMonitor
+	>>>type iterations:int
+	>>>para iterations:the iteration times of recurrent connection
+	>>>type checkpoint:str
+	>>>para checkpoint:file to save the model to at the best validation precision, suffixed by the fold for cross-validation, not saved if None
+	>>>type resume:bool
+	>>>para resume:continue from the training states in ../Models/ and skip the finished folds
 	'''
 	categories=config['classes']
 	sets=config['all']
@@ -75,197 +226,76 @@ def parseConfig(sentences,vocab,config,vectors,wordIndex,static,name):
 	cross=config['cross']
 	dimension=len(vectors[0])
 	batchSize=25
-
-	maxLen=0
-	for sentence in sentences:
-		length=len(sentence['text'])
-		if length>maxLen:
-			maxLen=length
-
-	setMatrix={}
-	setClasses={}
-	for subset in sets:
-		setMatrix[subset]=[]
-		setClasses[subset]=[]
-
-	for sentence in sentences:
-		vec=parseSentence(sentence['text'],wordIndex,maxLen)
-		setLabel=sentence['setLabel']
-		category=sentence['label']
-		setMatrix[setLabel].append(vec)
-		setClasses[setLabel].append(category)
+	filters=(3,4,5)
+
+	maxLen=int(corpus['len'].max())
+	labels=corpus['label']
+	setLabels=corpus['setLabel']
+	matrix=None
+	bounds=None
+	if buckets>1:
+		bounds=bucketBounds(corpus['len'],buckets,max(filters))
+		print 'bucket lengths: '+str(bounds)
+	else:
+		matrix=encodeCorpus(corpus,maxLen)
 
 	if cross==False:
-		trainSet={};trainSetX=[];trainSetY=[]
-		validateSet={};validationSetX=[];validationSetY=[]
-		testSet={};testSetX=[];testSetY=[]
-		for subset in train:
-			trainSetX+=setMatrix[subset]
-			trainSetY+=setClasses[subset]
-		for subset in validation:
-			validationSetX+=setMatrix[subset]
-			validationSetY+=setClasses[subset]
-		for subset in test:
-			testSetX+=setMatrix[subset]
-			testSetY+=setClasses[subset]
+		repeatRandom('../Models/%s.random'%name,resume)
+		trainIndex=subsetIndex(setLabels,train)
+		validationIndex=subsetIndex(setLabels,validation)
+		testIndex=subsetIndex(setLabels,test)
 
 		if len(validation)==0:				#No ValidationSet
-			newTrainSetX=[];newValidationSetX=[]
-			newTrainSetY=[];newValidationSetY=[]
-			index=0
-
-			validateEachType=int(len(trainSetX)*0.1/categories)
-			validationType=[]
-			for i in xrange(categories):
-				validationType.append(0)
-
-			for i in np.random.permutation(range(len(trainSetX))):
-				Type=trainSetY[i]
-				if validationType[Type]<validateEachType:
-					newValidationSetX.append(trainSetX[i])
-					newValidationSetY.append(trainSetY[i])
-					validationType[Type]+=1
-				else:
-					newTrainSetX.append(trainSetX[i])
-					newTrainSetY.append(trainSetY[i])
-				# if index<len(trainSetX)*0.9:
-				# 	newTrainSetX.append(trainSetX[i])
-				# 	newTrainSetY.append(trainSetY[i])
-				# else:
-				# 	newValidationSetX.append(trainSetX[i])
-				# 	newValidationSetY.append(trainSetY[i])
-				# index+=1
-			trainSetX=newTrainSetX;validationSetX=newValidationSetX
-			trainSetY=newTrainSetY;validationSetY=newValidationSetY
-				
-
-		if len(trainSetX)%batchSize>0:
-			extraNum=batchSize-len(trainSetX)%batchSize
-			extraIndex=np.random.permutation(range(len(trainSetX)))
-			for i in xrange(extraNum):
-				trainSetX.append(trainSetX[extraIndex[i]])
-				trainSetY.append(trainSetY[extraIndex[i]])
-
-		if len(validationSetX)%batchSize>0:
-			extraNum=batchSize-len(validationSetX)%batchSize
-			extraIndex=np.random.permutation(range(len(validationSetX)))
-			for i in xrange(extraNum):
-				validationSetX.append(validationSetX[extraIndex[i]])
-				validationSetY.append(validationSetY[extraIndex[i]])
-
-		#trainSize=len(trainSetX)
-		#validateSize=trainSize/5-(trainSize/5)%batchSize
-		#validateIndex=np.random.permutation(range(trainSize))
-		#for i in xrange(validateSize):
-		#	validateSetX.append(trainSetX[validateIndex[i]])
-		#	validateSetY.append(trainSetY[validateIndex[i]])
-
-		trainSet['x']=np.array(trainSetX,dtype=theano.config.floatX)
-		trainSet['y']=np.array(trainSetY,dtype=theano.config.floatX)
-		validateSet['x']=np.array(validationSetX,dtype=theano.config.floatX)
-		validateSet['y']=np.array(validationSetY,dtype=theano.config.floatX)
-		testSet['x']=np.array(testSetX,dtype=theano.config.floatX)
-		testSet['y']=np.array(testSetY,dtype=theano.config.floatX)
+			trainIndex,validationIndex=splitValidation(trainIndex,labels,categories)
+
+		if buckets>1:
+			trainSet=makeBucketSets(corpus,trainIndex,bounds,batchSize)
+			validateSet=makeBucketSets(corpus,validationIndex,bounds,batchSize)
+			testSet=makeBucketSets(corpus,testIndex,bounds)
+		else:
+			trainIndex=fillBatches(trainIndex,batchSize)
+			validationIndex=fillBatches(validationIndex,batchSize)
+
+			trainSet=makeSet(matrix,labels,trainIndex)
+			validateSet=makeSet(matrix,labels,validationIndex)
+			testSet=makeSet(matrix,labels,testIndex)
+
+		trainSet=dropWords(trainSet,corpus)
 
 		network=RCNNModel(
 			wordMatrix=vectors,
 			shape=(batchSize,1,maxLen,dimension),
-			filters=(3,4,5),
+			filters=filters,
 			rfilter=(5,1),
 			features=(80,),
-			time=1,categories=categories,
+			time=iterations,categories=categories,
 			static=static,
 			dropoutRate=(0.5,),
 			learningRate=0.01,
 			name=name
 		)
+		network.wordIndex=wordIndex
 
-		precision=network.train_validate_test(trainSet,validateSet,testSet,10)
+		precision=network.train_validate_test(trainSet,validateSet,testSet,10,monitor,checkpoint,'../Models/%s.state'%name,resume)
 		network.save()
+		exportModel(network,'../Models/%s.model.npz'%name,checkpoint,testSet)
 		print 'Model '+name+' :Final Precision Rate %f%%'%(precision*100.)
 	else:
-		precisions=[]
-		for item in sets:
-			trainSet={};trainSetX=[];trainSetY=[]
-			validateSet={};validationSetX=[];validationSetY=[]
-			testSet={};testSetX=[];testSetY=[]
-			for subset in sets:
-				if item!=subset:
-					trainSetX+=setMatrix[subset]
-					trainSetY+=setClasses[subset]
-				else:
-					testSetX+=setMatrix[subset]
-					testSetY+=setClasses[subset]
-
-			#No ValidationSet
-			newTrainSetX=[];newValidationSetX=[]
-			newTrainSetY=[];newValidationSetY=[]
-			
-			validateEachType=int(len(trainSetX)*0.1/categories)
-			validationType=[]
-			for i in xrange(categories):
-				validationType.append(0)
-
-			for i in np.random.permutation(range(len(trainSetX))):
-				Type=trainSetY[i]
-				if validationType[Type]<validateEachType:
-					newValidationSetX.append(trainSetX[i])
-					newValidationSetY.append(trainSetY[i])
-					validationType[Type]+=1
-				else:
-					newTrainSetX.append(trainSetX[i])
-					newTrainSetY.append(trainSetY[i])
-
-			# index=0
-			# for i in np.random.permutation(range(len(trainSetX))):
-			# 	if index<len(trainSetX)*0.9:
-			# 		newTrainSetX.append(trainSetX[i])
-			# 		newTrainSetY.append(trainSetY[i])
-			# 	else:
-			# 		newValidationSetX.append(trainSetX[i])
-			# 		newValidationSetY.append(trainSetY[i])
-			# 	index+=1
-			trainSetX=newTrainSetX;validationSetX=newValidationSetX
-			trainSetY=newTrainSetY;validationSetY=newValidationSetY
-
-
-			if len(trainSetX)%batchSize>0:
-				extraNum=batchSize-len(trainSetX)%batchSize
-				extraIndex=np.random.permutation(range(len(trainSetX)))
-				for i in xrange(extraNum):
-					trainSetX.append(trainSetX[extraIndex[i]])
-					trainSetY.append(trainSetY[extraIndex[i]])
-
-			if len(validationSetX)%batchSize>0:
-				extraNum=batchSize-len(validationSetX)%batchSize
-				extraIndex=np.random.permutation(range(len(validationSetX)))
-				for i in xrange(extraNum):
-					validationSetX.append(validationSetX[extraIndex[i]])
-					validationSetY.append(validationSetY[extraIndex[i]])
-
-			trainSet['x']=np.array(trainSetX,dtype=theano.config.floatX)
-			trainSet['y']=np.array(trainSetY,dtype=theano.config.floatX)
-			validateSet['x']=np.array(validationSetX,dtype=theano.config.floatX)
-			validateSet['y']=np.array(validationSetY,dtype=theano.config.floatX)
-			testSet['x']=np.array(testSetX,dtype=theano.config.floatX)
-			testSet['y']=np.array(testSetY,dtype=theano.config.floatX)
-
-			network=RCNNModel(
-				wordMatrix=vectors,
-				shape=(batchSize,1,maxLen,dimension),
-				filters=(3,4,5),
-				rfilter=(5,1),
-				features=(80,),
-				time=1,categories=categories,
-				static=static,
-				dropoutRate=(0.5,),
-				learningRate=0.01,
-				name=name
-			)
-
-			precision=network.train_validate_test(trainSet,validateSet,testSet,10)
-			network.save()
-			precisions.append(precision)
+		foldJob.clear()
+		foldJob.update({
+			'corpus':corpus,'matrix':matrix,'bounds':bounds,'vectors':vectors,'wordIndex':wordIndex,
+			'sets':sets,'categories':categories,'static':static,'name':name,
+			'buckets':buckets,'batchSize':batchSize,'filters':filters,'maxLen':maxLen,'dimension':dimension,
+			'monitor':monitor,'iterations':iterations,'checkpoint':checkpoint,'resume':resume
+		})
+		if workers>1:
+			pool=multiprocessing.Pool(workers)
+			results=pool.map(runFold,sets)
+			pool.close()
+			pool.join()
+		else:
+			results=[runFold(item) for item in sets]
+		precisions=[result['finalAcc'] for result in results]
 		print 'Model '+name+' :Final Precision Rate %f%%'%(np.mean(precisions)*100.)
 
 if __name__=='__main__':
@@ -274,6 +304,18 @@ if __name__=='__main__':
 	mode=0
 	dataFile=''
 	vecFile=''
+	cacheDir=None
+	phrases=False
+	minFreq=1
+	maxVocab=0
+	savedVocab=''
+	buckets=1
+	workers=1
+	monitor={}
+	iterations=1
+	checkpoint=None
+	resume=False
+	hashBuckets=None
 	name='Model'
 
 	for i in xrange(len(sys.argv)):
@@ -285,6 +327,32 @@ if __name__=='__main__':
 			mode=2
 		elif sys.argv[i]=='-n':
 			mode=3
+		elif sys.argv[i]=='-c':
+			mode=4
+		elif sys.argv[i]=='-b':
+			mode=5
+		elif sys.argv[i]=='-w':
+			mode=6
+		elif sys.argv[i]=='-e':
+			mode=7
+		elif sys.argv[i]=='-s':
+			mode=8
+		elif sys.argv[i]=='-vs':
+			mode=9
+		elif sys.argv[i]=='-t':
+			mode=10
+		elif sys.argv[i]=='-k':
+			mode=11
+		elif sys.argv[i]=='-unk':
+			mode=12
+		elif sys.argv[i]=='-minfreq':
+			mode=13
+		elif sys.argv[i]=='-maxvocab':
+			mode=14
+		elif sys.argv[i]=='-compiledir':
+			mode=15
+		elif sys.argv[i]=='-vocab':
+			mode=16
 		else:
 			if mode==1:
 				dataFile=sys.argv[i]
@@ -295,6 +363,44 @@ if __name__=='__main__':
 			elif mode==3:
 				name=sys.argv[i]
 				mode=0
+			elif mode==4:
+				cacheDir=sys.argv[i]
+				mode=0
+			elif mode==5:
+				buckets=int(sys.argv[i])
+				mode=0
+			elif mode==6:
+				workers=int(sys.argv[i])
+				mode=0
+			elif mode==7:
+				monitor['examples']=int(sys.argv[i])
+				mode=0
+			elif mode==8:
+				monitor['seconds']=float(sys.argv[i])
+				mode=0
+			elif mode==9:
+				monitor['validateBatches']=int(sys.argv[i])
+				mode=0
+			elif mode==10:
+				iterations=int(sys.argv[i])
+				mode=0
+			elif mode==11:
+				checkpoint=sys.argv[i]
+				mode=0
+			elif mode==12:
+				hashBuckets=int(sys.argv[i])
+				mode=0
+			elif mode==13:
+				minFreq=int(sys.argv[i])
+				mode=0
+			elif mode==14:
+				maxVocab=int(sys.argv[i])
+				mode=0
+			elif mode==15:				#applied before theano was imported
+				mode=0
+			elif mode==16:
+				savedVocab=sys.argv[i]
+				mode=0
 			else:
 				if sys.argv[i]=='-nonstatic':
 					static=False
@@ -304,9 +410,19 @@ if __name__=='__main__':
 					rand=True
 				elif sys.argv[i]=='-word2vec':
 					rand=False
+				elif sys.argv[i]=='-nocache':
+					cacheDir=''
+				elif sys.argv[i]=='-phrases':
+					phrases=True
+				elif sys.argv[i]=='-monitor':
+					monitor['running']=True
+				elif sys.argv[i]=='-resume':
+					resume=True
 				else:
 					raise NotImplementedError('command line error')
-	print 'config: dataFile:%s, vecFile:%s, static:%r, rand:%r'%(dataFile,vecFile,static,rand)
+	if cacheDir==None:
+		cacheDir=os.path.join(os.path.dirname(os.path.abspath(dataFile)),'wordVecCache')
+	print 'config: dataFile:%s, vecFile:%s, static:%r, rand:%r, cacheDir:%s, buckets:%d, workers:%d, monitor:%r, iterations:%d, checkpoint:%s, resume:%r, hashBuckets:%r'%(dataFile,vecFile,static,rand,cacheDir,buckets,workers,monitor,iterations,checkpoint,resume,hashBuckets)
 
 	saveFile='../Models/'+name
 	fwrite=open(saveFile,'w')
@@ -329,5 +445,5 @@ if __name__=='__main__':
 	fwrite.close()
 	print 'model '+name+' saved!'
 
-	sentences,vocab,config,vectors,wordIndex=loadDatas(dataFile=dataFile,wordVecFile=vecFile,dimension=300,rand=rand)
-	parseConfig(sentences,vocab,config,vectors,wordIndex,static,name)
+	corpus,vocab,config,vectors,wordIndex=loadDatas(dataFile=dataFile,wordVecFile=vecFile,dimension=300,rand=rand,cacheDir=cacheDir,hashBuckets=hashBuckets,phrases=phrases,minFreq=minFreq,maxVocab=maxVocab,vocabFile=saveFile+'.vocab.npz',savedVocab=savedVocab)
+	parseConfig(corpus,vocab,config,vectors,wordIndex,static,name,buckets,workers,monitor,iterations,checkpoint,resume)
@@ -0,0 +1,210 @@
+import json,sys,time
+import threading,Queue
+import collections
+import BaseHTTPServer,SocketServer
+import numpy as np
+
+from predictRCNN import *
+
+class MicroBatcher(object):
+	'''
+	>>>collect sentences submitted by concurrent requests and classify them together, a batch is run once it is full or its first sentence has waited for the latency budget
+	'''
+	def __init__(self,network,budget,maxBatch=None,history=10000):
+		'''
+		>>>type network: RCNNModel or NumpyRCNNModel
+		>>>para network: model loaded by loadModel
+		>>>type budget: float
+		>>>para budget: seconds a sentence may wait for others to join its batch
+		>>>type maxBatch: int
+		>>>para maxBatch: maximum num of sentences of one batch, the minibatch size of the model if None
+		>>>type history: int
+		>>>para history: num of recent requests kept for latency statistics
+		'''
+		self.network=network
+		self.budget=budget
+		self.maxBatch=maxBatch if maxBatch!=None else network.batchSize
+		self.rows=embeddingRows(network)
+		self.queue=Queue.Queue()
+		self.latencies=collections.deque(maxlen=history)
+		self.batchSizes=collections.deque(maxlen=history)
+		self.lock=threading.Lock()
+		self.requests=0
+
+		#compiled theano functions are only called from this thread
+		self.worker=threading.Thread(target=self.run)
+		self.worker.daemon=True
+		self.worker.start()
+
+	def submit(self,sentence):
+		'''
+		>>>classify one raw sentence, block until its batch is done, return the label and the class probabilities
+		'''
+		request={'sentence':sentence,'start':time.time(),'done':threading.Event()}
+		self.queue.put(request)
+		request['done'].wait()
+		if 'error' in request:
+			raise request['error']
+		with self.lock:
+			self.latencies.append(time.time()-request['start'])
+			self.requests+=1
+		return request['label'],request['probabilities']
+
+	def run(self):
+		while True:
+			batch=[self.queue.get()]
+			deadline=batch[0]['start']+self.budget
+			while len(batch)<self.maxBatch:
+				timeout=deadline-time.time()
+				if timeout<=0:
+					break
+				try:
+					batch.append(self.queue.get(True,timeout))
+				except Queue.Empty:
+					break
+			try:
+				matrix=encodeLines(
+					[request['sentence'] for request in batch],
+					self.network.wordIndex,self.network.sentenceLen,self.rows
+				)
+				probabilities=self.network.probabilities(matrix)
+				for request,probability in zip(batch,probabilities):
+					request['label']=int(np.argmax(probability))
+					request['probabilities']=probability.tolist()
+			except Exception as e:
+				for request in batch:
+					request['error']=e
+			with self.lock:
+				self.batchSizes.append(len(batch))
+			for request in batch:
+				request['done'].set()
+
+	def stats(self):
+		'''
+		>>>latency percentiles in milliseconds and the mean batch size over the recent requests
+		'''
+		with self.lock:
+			latencies=np.array(self.latencies)
+			batchSizes=np.array(self.batchSizes)
+			requests=self.requests
+		if len(latencies)==0:
+			return {'requests':requests}
+		return {
+			'requests':requests,
+			'p50':float(np.percentile(latencies,50)*1000),
+			'p99':float(np.percentile(latencies,99)*1000),
+			'meanBatch':float(batchSizes.mean())
+		}
+
+class PredictHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	'''
+	>>>POST / with a raw sentence as the body returns {'label','probabilities'}, GET /stats returns the latency statistics
+	'''
+	def do_POST(self):
+		length=int(self.headers.getheader('content-length',0))
+		sentence=self.rfile.read(length)
+		try:
+			label,probabilities=self.server.batcher.submit(sentence)
+		except Exception as e:
+			self.reply(500,{'error':str(e)})
+			return
+		self.reply(200,{'label':label,'probabilities':probabilities})
+
+	def do_GET(self):
+		if self.path=='/stats':
+			self.reply(200,self.server.batcher.stats())
+		else:
+			self.reply(404,{'error':'unknown path '+self.path})
+
+	def reply(self,code,content):
+		body=json.dumps(content)
+		self.send_response(code)
+		self.send_header('Content-Type','application/json')
+		self.send_header('Content-Length',str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self,format,*args):
+		pass
+
+class PredictServer(SocketServer.ThreadingMixIn,BaseHTTPServer.HTTPServer):
+	daemon_threads=True
+	request_queue_size=128
+
+	def __init__(self,address,batcher):
+		BaseHTTPServer.HTTPServer.__init__(self,address,PredictHandler)
+		self.batcher=batcher
+
+def reportStats(batcher,interval):
+	'''
+	>>>write the latency statistics to stderr every interval seconds
+	'''
+	while True:
+		time.sleep(interval)
+		stats=batcher.stats()
+		if 'p50' in stats:
+			sys.stderr.write('%d requests, p50 %.2fms, p99 %.2fms, mean batch %.1f\n'%(
+				stats['requests'],stats['p50'],stats['p99'],stats['meanBatch']
+			))
+
+if __name__=='__main__':
+	mode=0
+	modelFile=''
+	port=8000
+	budget=10.0
+	maxBatch=None
+	interval=30.0
+	useNumpy=False
+
+	for i in xrange(len(sys.argv)):
+		if i==0:
+			continue
+		if sys.argv[i]=='-m':
+			mode=1
+		elif sys.argv[i]=='-p':
+			mode=2
+		elif sys.argv[i]=='-l':
+			mode=3
+		elif sys.argv[i]=='-b':
+			mode=4
+		elif sys.argv[i]=='-s':
+			mode=5
+		else:
+			if mode==1:
+				modelFile=sys.argv[i]
+				mode=0
+			elif mode==2:
+				port=int(sys.argv[i])
+				mode=0
+			elif mode==3:
+				budget=float(sys.argv[i])
+				mode=0
+			elif mode==4:
+				maxBatch=int(sys.argv[i])
+				mode=0
+			elif mode==5:
+				interval=float(sys.argv[i])
+				mode=0
+			else:
+				if sys.argv[i]=='-numpy':
+					useNumpy=True
+				else:
+					raise NotImplementedError('command line error')
+	if modelFile=='':
+		print 'Usage: python serveRCNN.py -m <checkpoint, or exported model with -numpy> [-numpy] [-p <port>] [-l <latency budget in ms>] [-b <max batch>] [-s <stats interval in seconds>]'
+		exit(0)
+
+	network=loadModel(modelFile,useNumpy)
+
+	batcher=MicroBatcher(network,budget/1000.0,maxBatch)
+	reporter=threading.Thread(target=reportStats,args=(batcher,interval))
+	reporter.daemon=True
+	reporter.start()
+
+	server=PredictServer(('127.0.0.1',port),batcher)
+	print 'serving on 127.0.0.1:%d, latency budget %.1fms, max batch %d'%(port,budget,batcher.maxBatch)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
@@ -1,45 +1,223 @@
 #!/usr/bin/python2.7
 # -*- coding: utf-8 -*- 
-import cPickle
+import cPickle,os,sys,time
+import multiprocessing
+import collections,hashlib
 import re
+import numpy as np
 
 from collections import defaultdict
 
+#the first pattern has no brackets, so it only matches this literal text at the start of a sentence
+literalPattern=re.compile(r'^A-Za-z0-9(),!?\'\`')
+spacePattern=re.compile(r'\s{2,}')
+
 def cleanStr(string):
-	string=re.sub(r'^A-Za-z0-9(),!?\'\`',' ',string)
-	string=re.sub(r'\s{2,}',' ',string)
-	string=string.replace('Ã¡','á').replace('Ã©','é').replace('Ã±','ñ').replace('Â','').replace('Ã¯','ï')
-	string=string.replace('Ã¼','ü').replace('Ã¢','â').replace('Ã¨','è').replace('Ã¶','ö').replace('Ã¦','æ')
-	string=string.replace('Ã³','ó').replace('Ã»','û').replace('Ã´','ô').replace('Ã£','ã').replace('Ã§','ç')
-	string=string.replace('Ã  ','à ').replace('Ã','í').replace('í­','í')
+	'''
+	>>>the replacements only fix mis-decoded characters, all of which start with the byte \xc3, so they are skipped for clean ascii sentences
+	'''
+	string=literalPattern.sub(' ',string)
+	string=spacePattern.sub(' ',string)
+	if '\xc3' in string:
+		string=string.replace('Ã¡','á').replace('Ã©','é').replace('Ã±','ñ').replace('Â','').replace('Ã¯','ï')
+		string=string.replace('Ã¼','ü').replace('Ã¢','â').replace('Ã¨','è').replace('Ã¶','ö').replace('Ã¦','æ')
+		string=string.replace('Ã³','ó').replace('Ã»','û').replace('Ã´','ô').replace('Ã£','ã').replace('Ã§','ç')
+		string=string.replace('Ã  ','à ').replace('Ã','í').replace('í­','í')
 	return string
 
-def loadSentences(fileName):
+def cleanPhrase(phrase):
+	'''
+	>>>restore the brackets of a sentence or phrase of the treebank and clean it
+	'''
+	return cleanStr(phrase.replace('-LRB-','(').replace('-RRB-',')').replace('\n',''))
+
+def cleanLines(lines):
+	'''
+	>>>clean a chunk of sentences or phrases, the unit of work of the worker processes
+	'''
+	return [cleanPhrase(line) for line in lines]
+
+def cleanSentenceLines(lines):
+	'''
+	>>>parse and clean a chunk of lines of datasetSentences.txt into (sentence index, sentence) pairs
+	'''
+	results=[]
+	for line in lines:
+		parts=line.split('\t')
+		results.append((int(parts[0]),cleanPhrase(parts[1])))
+	return results
+
+def needsCleaning(phrase):
+	'''
+	>>>whether cleanPhrase may change the phrase: brackets to restore, mis-decoded bytes or whitespace to collapse, checked without any regex
+	'''
+	return '-' in phrase or '\xc3' in phrase or '  ' in phrase or '\t' in phrase or '\n' in phrase or '\r' in phrase or '\x0b' in phrase or '\x0c' in phrase
+
+def cleanDictLines(lines):
+	'''
+	>>>parse a chunk of lines of dictionary.txt into (cleaned phrase, sentiment index) pairs
+	'''
+	results=[]
+	for line in lines:
+		parts=line.split('|')
+		phrase=parts[0]
+		if needsCleaning(phrase):
+			phrase=cleanPhrase(phrase)
+		results.append((phrase,int(parts[1])))
+	return results
+
+sentenceLengths=set()
+sentenceDigests={}
+
+def setSentenceKeys(lengths,digests):
+	'''
+	>>>set the cleaned sentences that phrases are matched against, in each worker process
+	'''
+	global sentenceLengths,sentenceDigests
+	sentenceLengths=lengths
+	sentenceDigests=digests
+
+def matchDictLines(lines):
+	'''
+	>>>parse a chunk of lines of dictionary.txt, return the (md5 digest, sentiment index) pairs of the phrases equal to a sentence after cleaning
+	>>>a phrase is only cleaned if needsCleaning, and only hashed if its length is the length of some sentence
+	'''
+	results=[]
+	for line in lines:
+		parts=line.split('|')
+		phrase=parts[0]
+		if needsCleaning(phrase):
+			phrase=cleanPhrase(phrase)
+		if len(phrase) not in sentenceLengths:
+			continue
+		digest=hashlib.md5(phrase).digest()
+		if digest in sentenceDigests:
+			results.append((digest,int(parts[1])))
+	return results
+
+def chunkLines(lines,chunkSize):
+	'''
+	>>>group an iterable of lines into lists of chunkSize lines
+	'''
+	chunk=[]
+	for line in lines:
+		chunk.append(line)
+		if len(chunk)==chunkSize:
+			yield chunk
+			chunk=[]
+	if len(chunk)>0:
+		yield chunk
+
+def cleanStream(lines,workers=1,chunkSize=2000,clean=cleanLines,initializer=None,initargs=()):
+	'''
+	>>>clean an iterable of sentences or phrases in chunks, in worker processes if workers>1, yield the results in input order and report lines per second at the end
+	>>>at most 2*workers chunks are in flight, so memory stays bounded however long the input is
+
+	>>>type lines: iterable of str
+	>>>para lines: raw sentences or phrases
+	>>>type workers: int
+	>>>para workers: num of worker processes
+	>>>type chunkSize: int
+	>>>para chunkSize: num of lines sent to a worker at a time
+	>>>type clean: function
+	>>>para clean: maps a chunk of lines to a list of results, defined at module level so that workers can unpickle it
+	>>>type initializer/initargs: function/tuple
+	>>>para initializer/initargs: called with initargs in each worker, or once in this process if workers==1
+	'''
+	start=time.time()
+	num=0
+	if workers>1:
+		pool=multiprocessing.Pool(workers,initializer,initargs)
+	else:
+		pool=None
+		if initializer!=None:
+			initializer(*initargs)
+	pending=collections.deque()
+	for chunk in chunkLines(lines,chunkSize):
+		num+=len(chunk)
+		if pool==None:
+			results=clean(chunk)
+		else:
+			pending.append(pool.apply_async(clean,(chunk,)))
+			if len(pending)<2*workers:
+				continue
+			results=pending.popleft().get()
+		for result in results:
+			yield result
+	while len(pending)>0:
+		for result in pending.popleft().get():
+			yield result
+	if pool!=None:
+		pool.close()
+		pool.join()
+	seconds=time.time()-start
+	print '%d lines cleaned in %fs, %f lines/sec'%(num,seconds,num/max(seconds,1e-6))
+
+def loadSentences(fileName,workers=1):
 	Index2Sentence={}
 	Sentence2Index={}
 	with open(fileName,'r') as fopen:
-		i=0
-		for line in fopen:
-			if i>0:
-				parts=line.split('\t')
-				index=int(parts[0])
-				sentence=parts[1].replace('-LRB-','(').replace('-RRB-',')').replace('\n','')
-				sentence=cleanStr(sentence)				
-				Index2Sentence[index]=sentence
-				Sentence2Index[sentence]=index
-			i+=1
+		fopen.readline()
+		for index,sentence in cleanStream(fopen,workers,clean=cleanSentenceLines):
+			Index2Sentence[index]=sentence
+			Sentence2Index[sentence]=index
 	return Index2Sentence, Sentence2Index
 
-def lookupDict(dictFileName,Sentence2Index):
-	Sentence2SentimentIndex={}
+def dictCacheKey(dictFileName,digests):
+	'''
+	>>>hash the size and mtime of the phrase dictionary together with the sentences to match
+	'''
+	stat=os.stat(dictFileName)
+	md5=hashlib.md5()
+	for digest in sorted(digests):
+		md5.update(digest)
+	md5.update('%s|%d|%d'%(os.path.basename(dictFileName),stat.st_size,int(stat.st_mtime)))
+	return md5.hexdigest()
+
+def joinDict(dictFileName,digests,lengths,workers=1,cacheFile=''):
+	'''
+	>>>find the sentiment index of each sentence in the phrase dictionary, only the hashed sentences are held in memory while the dictionary is streamed
+	>>>the result is cached in cacheFile and reused while neither the dictionary nor the sentences change
+
+	>>>type dictFileName: str
+	>>>para dictFileName: dictionary.txt
+	>>>type digests: dict
+	>>>para digests: keys are md5 digests of the cleaned sentences
+	>>>type lengths: set
+	>>>para lengths: lengths of the cleaned sentences
+	>>>type workers: int
+	>>>para workers: num of cleaning processes
+	>>>type cacheFile: str
+	>>>para cacheFile: file of the cached result, no cache if empty
+	'''
+	if cacheFile!='':
+		key=dictCacheKey(dictFileName,digests)
+		if os.path.exists(cacheFile):
+			with open(cacheFile,'rb') as fopen:
+				cachedKey,matches=cPickle.load(fopen)
+			if cachedKey==key:
+				print 'phrase dictionary join loaded from cache '+cacheFile
+				return matches
+
+	matches={}
 	with open(dictFileName,'r') as fopen:
-		for line in fopen:
-			parts=line.split('|')
-			sentiment=parts[0].replace('-LRB-','(').replace('-RRB-',')').replace('\n','')
-			sentiment=cleanStr(sentiment)
-			index=int(parts[1])
-			if sentiment in Sentence2Index:
-				Sentence2SentimentIndex[sentiment]=index
+		for digest,index in cleanStream(fopen,workers,clean=matchDictLines,initializer=setSentenceKeys,initargs=(lengths,digests)):
+			matches[digest]=index
+	if cacheFile!='':
+		with open(cacheFile+'.tmp','wb') as fwrite:
+			cPickle.dump((key,matches),fwrite,protocol=cPickle.HIGHEST_PROTOCOL)
+		os.rename(cacheFile+'.tmp',cacheFile)
+	return matches
+
+def lookupDict(dictFileName,Sentence2Index,workers=1,cacheFile=''):
+	digests={}
+	for sentence in Sentence2Index:
+		digests[hashlib.md5(sentence).digest()]=sentence
+	lengths=set(len(sentence) for sentence in Sentence2Index)
+	matches=joinDict(dictFileName,digests,lengths,workers,cacheFile)
+	Sentence2SentimentIndex={}
+	for digest,index in matches.items():
+		Sentence2SentimentIndex[digests[digest]]=index
 	assert len(Sentence2SentimentIndex)==len(Sentence2Index)
 	for sentence in Sentence2Index:
 		if not sentence in Sentence2SentimentIndex:
@@ -83,24 +261,284 @@ def loadData(Sentence2Index,Index2Sentence,Sentence2SentimentIndex,SentimentInde
 		sentimentIndex=Sentence2SentimentIndex[sentence]
 		label=SentimentIndex2Label[sentimentIndex]
 		setLabel=Index2SetLabel[index]
-		clean=cleanStr(sentence)
+		#sentences were cleaned by loadSentences, and cleaning again changes nothing
+		clean=sentence
 		words=set(clean.split())
 		for word in words:
 			vocab[word]+=1
 		sentences.append({'label':label,'text':clean.split(),'setLabel':setLabel,'len':len(clean.split())})
 	return sentences,vocab
 
+def streamData(fileName,dictFileName,sentimentLabelFile,setLabelFile,writer,workers=1,cacheFile=''):
+	'''
+	>>>clean the sentences and append them to writer line by line, then stream the phrase dictionary once to find the label of each written sentence
+	>>>besides the vocabulary, only an md5 digest, a subset ID and a sentiment index per sentence are kept in memory, the labels and subset IDs are returned for writer.close
+
+	>>>type fileName/dictFileName/sentimentLabelFile/setLabelFile: str
+	>>>para fileName/dictFileName/sentimentLabelFile/setLabelFile: files of the treebank
+	>>>type writer: CompactWriter
+	>>>para writer: the dataset on disk
+	>>>type workers: int
+	>>>para workers: num of cleaning processes
+	>>>type cacheFile: str
+	>>>para cacheFile: file of the cached phrase dictionary join, no cache if empty
+	'''
+	Index2SetLabel=loadSetLabel(setLabelFile)
+	rows={}
+	lengths=set()
+	setLabels=[]
+	with open(fileName,'r') as fopen:
+		fopen.readline()
+		for index,sentence in cleanStream(fopen,workers,clean=cleanSentenceLines):
+			digest=hashlib.md5(sentence).digest()
+			#a repeated sentence is written once, with the subset of its last occurrence as in loadData
+			if digest in rows:
+				setLabels[rows[digest]]=Index2SetLabel[index]
+				continue
+			rows[digest]=writer.num
+			lengths.add(len(sentence))
+			setLabels.append(Index2SetLabel[index])
+			writer.append(sentence.split(),-1,-1)
+
+	sentimentIndex=np.zeros(writer.num,dtype='int64')-1
+	for digest,index in joinDict(dictFileName,rows,lengths,workers,cacheFile).items():
+		sentimentIndex[rows[digest]]=index
+	assert (sentimentIndex>=0).all()
+	SentimentIndex2Label=loadLabels(sentimentLabelFile)
+	return [SentimentIndex2Label[index] for index in sentimentIndex],setLabels
+
+def phraseSpans(dictFileName,sentences,SentimentIndex2Label,workers=1):
+	'''
+	>>>locate the phrases of the dictionary as token spans of the given sentences, so that phrases are stored as (sentence, start, length) instead of copies of their words
+	>>>each distinct phrase is kept once, at the first span it is found, and spans covering a whole sentence are left out since the sentence is already an instance
+
+	>>>type dictFileName: str
+	>>>para dictFileName: dictionary.txt
+	>>>type sentences: iterable
+	>>>para sentences: (row in the dataset, list of words) of each sentence whose phrases are wanted
+	>>>type SentimentIndex2Label: dict
+	>>>para SentimentIndex2Label: category of each sentiment index
+	>>>type workers: int
+	>>>para workers: num of cleaning processes
+	'''
+	phrases={}
+	maxLen=0
+	with open(dictFileName,'r') as fopen:
+		for phrase,index in cleanStream(fopen,workers,clean=cleanDictLines):
+			words=tuple(phrase.split())
+			if len(words)>0:
+				phrases[words]=index
+				maxLen=max(maxLen,len(words))
+	spans=[]
+	for row,words in sentences:
+		words=tuple(words)
+		for start in xrange(len(words)):
+			for end in xrange(start+1,min(start+maxLen,len(words))+1):
+				if end-start==len(words):
+					continue
+				index=phrases.pop(words[start:end],None)
+				if index!=None:
+					spans.append((row,start,end-start,SentimentIndex2Label[index]))
+	spans=np.array(spans,dtype='int32').reshape(-1,4)
+	print '%d phrases located'%len(spans)
+	return {'phraseRow':spans[:,0],'phraseStart':spans[:,1],'phraseLen':spans[:,2],'phraseLabel':spans[:,3]}
+
+def saveCompact(sentences,vocab,config,fileName,phrases=None):
+	'''
+	>>>save the dataset as flat arrays: word ids of all sentences concatenated with their offsets, and per-sentence label/setLabel/len
+
+	>>>type sentences: list
+	>>>para sentences: each entry is {'label','text','setLabel','len'}
+	>>>type vocab: dict
+	>>>para vocab: document frequency of each word
+	>>>type config: dict
+	>>>para config: config information of the dataset
+	>>>type fileName: str
+	>>>para fileName: *.npz file
+	>>>type phrases: dict
+	>>>para phrases: phrase spans returned by phraseSpans, saved along with the sentences if not None
+	'''
+	words=['']+vocab.keys()
+	wordId={}
+	for i in xrange(1,len(words)):
+		wordId[words[i]]=i
+	lengths=np.array([len(sentence['text']) for sentence in sentences],dtype='int32')
+	offsets=np.zeros(len(sentences)+1,dtype='int64')
+	offsets[1:]=np.cumsum(lengths)
+	tokens=np.fromiter(
+		(wordId[word] for sentence in sentences for word in sentence['text']),
+		dtype='int32',count=offsets[-1]
+	)
+	arrays=dict(
+		tokens=tokens,
+		offsets=offsets,
+		label=np.array([sentence['label'] for sentence in sentences],dtype='int32'),
+		setLabel=np.array([sentence['setLabel'] for sentence in sentences],dtype='int32'),
+		len=lengths,
+		words=np.array(words),
+		docFreq=np.array([0.]+[vocab[word] for word in words[1:]]),
+		classes=config['classes'],
+		all=np.array(config['all'],dtype='int32'),
+		train=np.array(config['train'],dtype='int32'),
+		test=np.array(config['test'],dtype='int32'),
+		dev=np.array(config['dev'],dtype='int32'),
+		cross=config['cross']
+	)
+	if phrases!=None:
+		arrays.update(phrases)
+	np.savez(fileName,**arrays)
+
+class CompactWriter(object):
+	'''
+	>>>write a dataset in the format of saveCompact sentence by sentence, token ids and per-sentence fields go to temporary files on disk
+	>>>only the vocabulary is kept in memory, word ids are given in order of first occurrence
+	'''
+	def __init__(self,fileName):
+		'''
+		>>>type fileName: str
+		>>>para fileName: *.npz file
+		'''
+		self.fileName=fileName
+		self.tokenFile=open(fileName+'.tokens.tmp','wb')
+		self.fieldFile=open(fileName+'.fields.tmp','wb')
+		self.words=['']
+		self.docFreq=[0.]
+		self.wordId={}
+		self.num=0
+
+	def append(self,words,label,setLabel):
+		'''
+		>>>append one sentence given as a list of words
+		'''
+		ids=np.empty(len(words),dtype='int32')
+		for i in xrange(len(words)):
+			word=words[i]
+			if word not in self.wordId:
+				self.wordId[word]=len(self.words)
+				self.words.append(word)
+				self.docFreq.append(0.)
+			ids[i]=self.wordId[word]
+		for wordId in set(ids.tolist()):
+			self.docFreq[wordId]+=1
+		ids.tofile(self.tokenFile)
+		np.array([label,setLabel,len(words)],dtype='int32').tofile(self.fieldFile)
+		self.num+=1
+
+	def written(self):
+		'''
+		>>>token ids and offsets of the sentences appended so far, the token ids are mapped from the temporary file
+		'''
+		self.tokenFile.flush()
+		self.fieldFile.flush()
+		fields=np.fromfile(self.fileName+'.fields.tmp',dtype='int32').reshape(-1,3)
+		if os.path.getsize(self.fileName+'.tokens.tmp')>0:
+			tokens=np.memmap(self.fileName+'.tokens.tmp',dtype='int32',mode='r')
+		else:
+			tokens=np.zeros(0,dtype='int32')
+		offsets=np.zeros(len(fields)+1,dtype='int64')
+		offsets[1:]=np.cumsum(fields[:,2])
+		return tokens,offsets,fields
+
+	def close(self,config,labels=None,setLabels=None,phrases=None):
+		'''
+		>>>assemble the *.npz file from the temporary files and remove them
+
+		>>>type config: dict
+		>>>para config: config information of the dataset
+		>>>type labels: list or np.array
+		>>>para labels: category of each sentence, replacing the labels given to append if not None
+		>>>type setLabels: list or np.array
+		>>>para setLabels: subset ID of each sentence, replacing the ones given to append if not None
+		>>>type phrases: dict
+		>>>para phrases: phrase spans returned by phraseSpans, saved along with the sentences if not None
+		'''
+		tokens,offsets,fields=self.written()
+		self.tokenFile.close()
+		self.fieldFile.close()
+		arrays=dict(
+			tokens=tokens,
+			offsets=offsets,
+			label=fields[:,0] if labels is None else np.asarray(labels,dtype='int32'),
+			setLabel=fields[:,1].copy() if setLabels is None else np.asarray(setLabels,dtype='int32'),
+			len=fields[:,2].copy(),
+			words=np.array(self.words),
+			docFreq=np.array(self.docFreq),
+			classes=config['classes'],
+			all=np.array(config['all'],dtype='int32'),
+			train=np.array(config['train'],dtype='int32'),
+			test=np.array(config['test'],dtype='int32'),
+			dev=np.array(config['dev'],dtype='int32'),
+			cross=config['cross']
+		)
+		if phrases!=None:
+			arrays.update(phrases)
+		np.savez(self.fileName,**arrays)
+		del tokens,arrays
+		os.remove(self.fileName+'.tokens.tmp')
+		os.remove(self.fileName+'.fields.tmp')
+
 path='./'
 
 if __name__=='__main__':
+	mode=0
+	workers=1
+	stream=False
+	withPhrases=False
+	cacheFile=path+'dictionary.cache'
+	for i in xrange(len(sys.argv)):
+		if i==0:
+			continue
+		if sys.argv[i]=='-w':
+			mode=1
+		elif sys.argv[i]=='-c':
+			mode=2
+		else:
+			if mode==1:
+				workers=int(sys.argv[i])
+				mode=0
+			elif mode==2:
+				cacheFile=sys.argv[i]
+				mode=0
+			elif sys.argv[i]=='-stream':
+				stream=True
+			elif sys.argv[i]=='-nocache':
+				cacheFile=''
+			elif sys.argv[i]=='-phrases':
+				withPhrases=True
+			else:
+				raise NotImplementedError('command line error')
+
 	fileName=path+'datasetSentences.txt'
 	dictFileName=path+'dictionary.txt'
 	sentimentLabelFile=path+'sentiment_labels.txt'
 	setLabelFile=path+'datasetSplit.txt'
-	Index2Sentence,Sentence2Index=loadSentences(fileName)
-	Sentence2SentimentIndex=lookupDict(dictFileName,Sentence2Index)
-	SentimentIndex2Label=loadLabels(sentimentLabelFile)
-	Index2SetLabel=loadSetLabel(setLabelFile)
-	sentences,vocab=loadData(Sentence2Index,Index2Sentence,Sentence2SentimentIndex,SentimentIndex2Label,Index2SetLabel)
-	cPickle.dump([sentences,vocab,{'classes':5,'all':[1,2,3],'train':[1],'test':[2],'dev':[3],'cross':False}],open('data','wb'))
+	config={'classes':5,'all':[1,2,3],'train':[1],'test':[2],'dev':[3],'cross':False}
+	if stream:
+		writer=CompactWriter('data.npz')
+		labels,setLabels=streamData(fileName,dictFileName,sentimentLabelFile,setLabelFile,writer,workers,cacheFile)
+		phrases=None
+		if withPhrases:
+			tokens,offsets,fields=writer.written()
+			trainSentences=(
+				(row,[writer.words[token] for token in tokens[offsets[row]:offsets[row+1]]])
+				for row in xrange(writer.num) if setLabels[row] in config['train']
+			)
+			phrases=phraseSpans(dictFileName,trainSentences,loadLabels(sentimentLabelFile),workers)
+			del tokens
+		writer.close(config,labels,setLabels,phrases)
+	else:
+		Index2Sentence,Sentence2Index=loadSentences(fileName,workers)
+		Sentence2SentimentIndex=lookupDict(dictFileName,Sentence2Index,workers,cacheFile)
+		SentimentIndex2Label=loadLabels(sentimentLabelFile)
+		Index2SetLabel=loadSetLabel(setLabelFile)
+		sentences,vocab=loadData(Sentence2Index,Index2Sentence,Sentence2SentimentIndex,SentimentIndex2Label,Index2SetLabel)
+		cPickle.dump([sentences,vocab,config],open('data','wb'))
+		phrases=None
+		if withPhrases:
+			trainSentences=(
+				(row,sentences[row]['text'])
+				for row in xrange(len(sentences)) if sentences[row]['setLabel'] in config['train']
+			)
+			phrases=phraseSpans(dictFileName,trainSentences,SentimentIndex2Label,workers)
+		saveCompact(sentences,vocab,config,'data.npz',phrases)
 	print 'data processed'